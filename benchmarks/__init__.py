@@ -0,0 +1,3 @@
+"""
+Benchmarks of pycalc parsing and evaluation.
+"""
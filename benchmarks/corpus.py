@@ -0,0 +1,43 @@
+"""
+Representative expressions for benchmarks.
+"""
+from collections import namedtuple
+
+Case = namedtuple('Case', 'name modules expressions')
+
+DEFAULT_MODULES = ('builtins', 'math')
+
+
+def nested(depth):
+    """
+    Returns expression with depth nested brackets.
+    """
+    return '(' * depth + '1+2' + ')' * depth
+
+
+def flat_sum(length):
+    """
+    Returns sum of length numbers.
+    """
+    return '+'.join(str(number) for number in range(length))
+
+
+CORPUS = [
+    Case('short_arithmetic', DEFAULT_MODULES, [
+        '2+2', '1+2*3-4/5', '2^10', '10//3+10%3', '-13', '6-(-13)', '1---1', '3>=2',
+        '1+2*(3-4)^2', '.5*4e2',
+    ]),
+    Case('deep_nesting', DEFAULT_MODULES, [nested(16), nested(64), nested(256)]),
+    Case('long_flat_sums', DEFAULT_MODULES, [flat_sum(100), flat_sum(1000)]),
+    Case('math_calls', DEFAULT_MODULES, [
+        'sin(pi/2)', 'log(e^2)+log10(100)', 'sqrt(sin(2)^2+cos(2)^2)',
+        'atan2(1, 2)*degrees(pi)', 'round(exp(1.5)*sinh(0.5), 3)',
+        'hypot(3, 4)+gamma(5)+factorial(6)', 'sin(cos(tan(log(abs(-2)))))',
+    ]),
+    Case('implicit_multiplication', DEFAULT_MODULES, [
+        '2(3+4)', '(1+2)3', '2(3+1)5', '10(2+3)^2', 'sin(pi/2)1116',
+    ]),
+    Case('module_scopes', DEFAULT_MODULES + ('cmath', 'colorsys', 'operator'), [
+        'max(hls_to_rgb(0.5, 0.5, 0.5))', 'phase(1)+truediv(1, 2)', 'sin(pi/2)+abs(-2)',
+    ]),
+]
@@ -0,0 +1,153 @@
+"""
+Benchmark harness: measures ModulesScope construction, Expression.__init__
+(validation and preprocessing) and execute() for expressions of corpus,
+saves results to JSON and compares them with baseline.
+
+Usage:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json --threshold 0.25
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from benchmarks.corpus import CORPUS
+from pycalc.calcexpression import Expression
+from pycalc.moduleloader import ModulesScope
+
+PHASES = ('scope', 'init', 'execute')
+
+
+def measure(func, repeat, number):
+    """
+    Returns the best time of number calls of func in seconds per call.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def run_case(case, repeat=5, number=20):
+    """
+    Returns dict of times of phases of case in seconds:
+        scope: creating ModulesScope and loading all its names;
+        init: creating Expression for every expression of case;
+        execute: execute() of every new Expression (parse and evaluate).
+    """
+    def create_scope():
+        ModulesScope(*case.modules).get_callable_objects()
+
+    scope = ModulesScope(*case.modules)
+    for expr in case.expressions:
+        Expression(expr, scope=scope).execute()
+
+    def create_expressions():
+        for expr in case.expressions:
+            Expression(expr, scope=scope)
+
+    def execute():
+        for expression in expressions.pop():
+            expression.execute()
+
+    expressions = []
+
+    def prepare():
+        expressions.extend(
+            [Expression(expr, scope=scope) for expr in case.expressions] for _ in range(repeat * number)
+        )
+
+    prepare()
+    return {
+        'scope': measure(create_scope, repeat, number),
+        'init': measure(create_expressions, repeat, number),
+        'execute': measure(execute, repeat, number),
+    }
+
+
+def run(repeat=5, number=20, cases=None):
+    """
+    Returns benchmark report: environment and times of phases by case.
+    """
+    results = {}
+    for case in CORPUS:
+        if cases and case.name not in cases:
+            continue
+        results[case.name] = run_case(case, repeat, number)
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    Returns list of tuples of case, phase, baseline time, time and ratio for
+    every phase which is slower than baseline by more than threshold.
+    """
+    regressions = []
+    for case, phases in report['results'].items():
+        for phase, value in phases.items():
+            base = baseline['results'].get(case, {}).get(phase)
+            if base and value / base > 1 + threshold:
+                regressions.append((case, phase, base, value, value / base))
+    return regressions
+
+
+def print_report(report, baseline=None):
+    """
+    Prints table of times in microseconds and ratios to baseline.
+    """
+    print('{:<26}{:>14}{:>14}{:>14}'.format('case', *PHASES))
+    for case, phases in report['results'].items():
+        cells = []
+        for phase in PHASES:
+            cell = '{:.1f}'.format(phases[phase] * 1e6)
+            base = baseline['results'].get(case, {}).get(phase) if baseline else None
+            if base:
+                cell += ' x{:.2f}'.format(phases[phase] / base)
+            cells.append(cell)
+        print('{:<26}{:>14}{:>14}{:>14}'.format(case, *cells))
+
+
+def main(argv=None):
+    """
+    Runs benchmarks. Returns exit status: 1 if there are regressions.
+    """
+    parser = argparse.ArgumentParser(description='pycalc benchmarks')
+    parser.add_argument('--output', help='file to save JSON results to')
+    parser.add_argument('--baseline', help='JSON results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown relative to baseline, 0.25 is 25%%')
+    parser.add_argument('--repeat', type=int, default=5, help='number of measurements, the best is used')
+    parser.add_argument('--number', type=int, default=20, help='number of runs per measurement')
+    parser.add_argument('--case', action='append', help='run only this case, may be repeated')
+    args = parser.parse_args(argv)
+
+    report = run(args.repeat, args.number, args.case)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+    if baseline is None:
+        return 0
+    regressions = compare(report, baseline, args.threshold)
+    for case, phase, base, value, ratio in regressions:
+        print('REGRESSION: {} {}: {:.1f}us -> {:.1f}us (x{:.2f})'.format(
+            case, phase, base * 1e6, value * 1e6, ratio))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Complexity scaling: measures Expression(...).execute() for generated
+expressions of growing size and fits exponent of growth curve
+time ~ size ^ exponent on log-log scale.
+
+Usage:
+    python -m benchmarks.scaling
+
+Exits with status 1 if growth of any generator exceeds MAX_EXPONENT. The
+check measures wall-clock time, so it is not a part of unit tests.
+"""
+import math
+import sys
+
+from benchmarks.run import measure
+from pycalc.calcexpression import Expression
+from pycalc.moduleloader import ModulesScope
+
+SIZES = (250, 500, 1000, 2000, 4000)
+
+MAX_EXPONENT = 1.5
+
+NAMES = ('pi', 'e', 'tau', 'sin(1)', 'cos(2)', 'sqrt(3)', 'abs(-4)', 'log(5)')
+
+
+def length(size):
+    """
+    Returns flat expression of size terms.
+    """
+    return '+'.join('{}*2'.format(number) for number in range(size))
+
+
+def bracket_depth(size):
+    """
+    Returns expression with size nested brackets.
+    """
+    return '(' * size + '1' + '+1)' * size
+
+
+def call_depth(size):
+    """
+    Returns expression with size nested calls of callable object.
+    """
+    return 'abs(' * size + '-1' + ')' * size
+
+
+def identifiers(size):
+    """
+    Returns expression with size constants and callable objects.
+    """
+    return '+'.join(NAMES[number % len(NAMES)] for number in range(size))
+
+
+GENERATORS = {
+    'length': length,
+    'bracket_depth': bracket_depth,
+    'call_depth': call_depth,
+    'identifiers': identifiers,
+}
+
+
+def fit_exponent(sizes, times):
+    """
+    Returns slope of least squares line through (log(size), log(time))
+    points.
+    """
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(time) for time in times]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    covariance = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys))
+    variance = sum((x - x_mean) ** 2 for x in xs)
+    return covariance / variance
+
+
+def growth(generator, sizes=SIZES, scope=None, repeat=3):
+    """
+    Returns tuple of exponent of growth of execute() time and list of times
+    of expressions generated for sizes.
+
+    Positional arguments:
+        generator: function which returns expression string of given size
+
+    Optional keyword arguments:
+        sizes: sizes of generated expressions
+        scope: ModulesScope of expressions, builtins and math by default
+        repeat: number of measurements of each size, the best one is used
+    """
+    scope = scope or ModulesScope('builtins', 'math')
+    times = []
+    for size in sizes:
+        expr = generator(size)
+        Expression(expr, scope=scope).execute()
+        times.append(measure(lambda: Expression(expr, scope=scope).execute(), repeat, 1))
+    return fit_exponent(sizes, times), times
+
+
+def main():
+    """
+    Prints exponent of growth for every generator. Returns 1 if any exponent
+    exceeds MAX_EXPONENT also when it is measured again with more repeats,
+    so single noisy measurement does not fail the check.
+    """
+    scope = ModulesScope('builtins', 'math')
+    status = 0
+    for name, generator in GENERATORS.items():
+        exponent, times = growth(generator, scope=scope)
+        if exponent > MAX_EXPONENT:
+            exponent, times = growth(generator, scope=scope, repeat=5)
+        print('{:15} {:5.2f}  {}'.format(
+            name, exponent, ' '.join('{:.2f}ms'.format(time * 1000) for time in times)
+        ))
+        if exponent > MAX_EXPONENT:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,41 +2,153 @@
 """
 Provides console user interface for pycalc.
 """
-import argparse
+import sys
 from collections import namedtuple
+from functools import partial
 
-from pycalc.moduleloader import ModulesScope
+from pycalc.moduleloader import ModuleLoader, ModulesScope
+from pycalc.scopesnapshot import ScopeSnapshot
 from pycalc.calcexpression import Expression
+from pycalc.client import forward, print_response
 from pycalc.exceptions import exceptions_handler
 
 
-Arguments = namedtuple("Arguments", "EXPRESSION use_modules")
+Arguments = namedtuple(
+    "Arguments",
+    "EXPRESSION use_modules file jobs chunk_size serve socket tcp unrestricted max_nodes max_int_bits max_exponent "
+    "timeout profile",
+    defaults=(None, 1, 1000, False, None, None, False, None, None, None, None, False),
+)
+
+
+def parse_arguments():
+    """
+    Returns parsed arguments of command line.
+    """
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('EXPRESSION', nargs='?', help='expression string to evaluate')
+    parser.add_argument('-m', '--use-modules', nargs='+', help='additional modules to use')
+    parser.add_argument('-f', '--file', type=argparse.FileType('r'),
+                        help='file with one expression per line to evaluate, - for stdin')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes for --file, 0 for number of CPUs')
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help='number of lines sent to worker process at once')
+    parser.add_argument('--serve', action='store_true',
+                        help='run daemon which evaluates expressions of pycalc clients')
+    parser.add_argument('--socket', help='path of daemon socket')
+    parser.add_argument('--tcp', type=int, metavar='PORT',
+                        help='run asyncio JSON lines server on local TCP port with --serve')
+    parser.add_argument('--unrestricted', action='store_true',
+                        help='allow callable objects with side effects like open or exec in TCP server, '
+                             'unsafe: any local user may run code as you')
+    parser.add_argument('--max-nodes', type=int, help='maximal number of nodes of expression')
+    parser.add_argument('--max-int-bits', type=int,
+                        help='maximal bit length of integer results and length of repeated sequences')
+    parser.add_argument('--max-exponent', type=int, help='maximal integer exponent of power')
+    parser.add_argument('--timeout', type=float,
+                        help='maximal evaluation time of expression in seconds, checked between calls')
+    parser.add_argument('--profile', action='store_true',
+                        help='print times of phases, operators, callable objects and subexpressions')
+    args = parser.parse_args()
+    if not args.serve and (args.EXPRESSION is None) == (args.file is None):
+        parser.error('either EXPRESSION or --file is required')
+    if args.jobs < 0 or args.chunk_size < 1:
+        parser.error('--jobs must not be negative and --chunk-size must be positive')
+    if args.profile and args.EXPRESSION is None:
+        parser.error('--profile requires EXPRESSION')
+    return args
+
+
+def get_limits(args):
+    """
+    Returns EvaluationLimits of arguments or None if no limits are given.
+    """
+    values = (args.max_nodes, args.max_int_bits, args.max_exponent, args.timeout)
+    if all(value is None for value in values):
+        return None
+    from pycalc.limits import EvaluationLimits
+    return EvaluationLimits(*values)
+
+
+def serve(args, modules, limits):
+    """
+    Runs Unix socket daemon, or asyncio TCP server if port is given.
+    """
+    if args.tcp is not None:
+        import asyncio
+        from pycalc import aioservice
+        try:
+            asyncio.run(aioservice.serve(port=args.tcp, modules=modules, unrestricted=args.unrestricted,
+                                         limits=limits))
+        except KeyboardInterrupt:
+            pass
+        return
+    from pycalc import daemon
+    try:
+        daemon.serve(args.socket, limits)
+    except OSError as error:
+        print("ERROR: {}".format(error))
+        sys.exit(2)
+
+
+def run_file(args, modules, modules_scope, limits):
+    """
+    Evaluates expressions from file in batch mode, in worker processes if
+    more than one job is requested.
+    """
+    from pycalc.batch import run_batch, write_results
+
+    with args.file:
+        if args.jobs == 1:
+            errors = run_batch(args.file, sys.stdout, scope=modules_scope, limits=limits)
+        else:
+            from pycalc.parallel import evaluate_parallel
+            results = evaluate_parallel(args.file, modules, jobs=args.jobs, chunksize=args.chunk_size,
+                                        limits=limits)
+            errors = write_results(results, sys.stdout)
+    if errors:
+        sys.exit(2)
 
 
 @exceptions_handler
 def main(expr=None, use_modules=None, silent=False):
     """
-    Handled arguments of command line, executed expression.
+    Handled arguments of command line, executed expression or expressions
+    from file in batch mode.
     """
     args = None
     modules = ['builtins', 'math']
     if expr:
         args = Arguments(expr, use_modules)
     if not args:
-        parser = argparse.ArgumentParser()
-        parser.add_argument('EXPRESSION', help='expression string to evaluate')
-        parser.add_argument('-m', '--use-modules', nargs='+', help='additional modules to use')
-        args = parser.parse_args()
+        args = parse_arguments()
     if args.use_modules:
         for module in args.use_modules:
             if module not in modules:
                 modules.append(module)
-    modules_scope = ModulesScope(*modules)
-    result = Expression(
-        args.EXPRESSION,
-        callable_objects=modules_scope.get_callable_objects(),
-        constants=modules_scope.get_constants()
-    ).execute()
+    limits = get_limits(args)
+    if args.serve:
+        serve(args, modules, limits)
+        return None
+    if not expr and not silent and args.file is None and limits is None and not args.profile:
+        response = forward(args.EXPRESSION, modules, args.socket)
+        if response is not None:
+            print_response(response)
+            return None
+    modules_scope = ModulesScope(*modules, module_loader=partial(ModuleLoader, snapshot=ScopeSnapshot()))
+    if args.file is not None:
+        run_file(args, modules, modules_scope, limits)
+        return None
+    expression = Expression(args.EXPRESSION, scope=modules_scope, limits=limits)
+    if args.profile:
+        from pycalc.profiler import format_report
+        report = expression.profile()
+        result = report.result
+        print(format_report(report), file=sys.stderr)
+    else:
+        result = expression.execute()
     if not silent:
         print(result)
     else:
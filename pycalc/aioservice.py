@@ -0,0 +1,247 @@
+"""
+This module provides asyncio evaluation service: concurrent requests are
+collected into small batches, which are evaluated against shared scope,
+and TCP server with JSON lines protocol built on it.
+"""
+import asyncio
+import json
+from functools import partial
+
+from pycalc.exceptions import PyCalcSyntaxError, get_error_message
+from pycalc.moduleloader import ModuleLoader, ModulesScope, is_pure_tree
+from pycalc.parsecache import ExpressionCache
+from pycalc.scopesnapshot import ScopeSnapshot
+
+
+class AsyncEvaluator:
+    """
+    Evaluates expressions for coroutines. Requests are put into bounded
+    queue, so callers wait when service is overloaded. Batches of up to
+    max_batch requests are evaluated by one executor call each, so no
+    thread is used per request and event loop is not blocked.
+
+    Timeout stops waiting for result only: expression which is already
+    being evaluated can not be interrupted.
+    """
+
+    def __init__(self, scope=None, cache=None, max_batch=64, max_delay=0.001, max_pending=1024,
+                 timeout=None, executor=None, limits=None, pure_only=False):
+        """
+        Optional keyword arguments:
+            scope: ModulesScope with callable objects and constants,
+                builtins by default
+            cache: ExpressionCache, new one by default
+            max_batch: maximal number of expressions in batch
+            max_delay: seconds to wait for more requests to fill batch
+            max_pending: maximal number of queued requests
+            timeout: default timeout of request in seconds
+            executor: concurrent.futures executor to evaluate batches in,
+                default executor of event loop by default
+            limits: EvaluationLimits of every expression
+            pure_only: if True, expressions which call callable objects
+                that are not pure, e.g. open or exec, are rejected with
+                PyCalcSyntaxError
+        """
+        self._limits = limits
+        self._pure_only = pure_only
+        self._scope = scope
+        self._cache = cache or ExpressionCache()
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._max_pending = max_pending
+        self._timeout = timeout
+        self._executor = executor
+        self._queue = None
+        self._worker = None
+
+    async def __aenter__(self):
+        """
+        Starts evaluator.
+        """
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """
+        Stops evaluator.
+        """
+        await self.close()
+
+    def start(self):
+        """
+        Starts batching task in running event loop.
+        """
+        if self._worker is None:
+            self._queue = asyncio.Queue(self._max_pending)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """
+        Stops batching task. Pending requests are cancelled.
+        """
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            self._queue.get_nowait()[1].cancel()
+        self._worker = None
+
+    async def evaluate(self, expr, timeout=None):
+        """
+        Returns result of expression. Raises exception of evaluation or
+        asyncio.TimeoutError.
+
+        Positional arguments:
+            expr: expression string
+
+        Optional keyword arguments:
+            timeout: timeout in seconds, default timeout by default
+        """
+        self.start()
+        timeout = timeout if timeout is not None else self._timeout
+        return await asyncio.wait_for(self._request(expr), timeout)
+
+    async def _request(self, expr):
+        """
+        Puts request into queue, waits while queue is full, and waits for
+        result. Cancellation cancels request, so it is not evaluated.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((expr, future))
+        return await future
+
+    async def _run(self):
+        """
+        Collects requests into batches and evaluates them in executor.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._max_delay
+            while len(batch) < self._max_batch:
+                if self._queue.empty():
+                    delay = deadline - loop.time()
+                    if delay <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), delay))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self._queue.get_nowait())
+            batch = [(expr, future) for expr, future in batch if not future.done()]
+            if not batch:
+                continue
+            try:
+                results = await loop.run_in_executor(self._executor, self._evaluate_batch,
+                                                     [expr for expr, _ in batch])
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    future.cancel()
+                raise
+            for (_, future), (value, error) in zip(batch, results):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(value)
+
+    def _evaluate_batch(self, expressions):
+        """
+        Returns list of tuples of value and exception of expressions.
+        """
+        results = []
+        for expr in expressions:
+            try:
+                expression = self._cache.get(expr, scope=self._scope, limits=self._limits)
+                if self._pure_only and not is_pure_tree(expression.compile()):
+                    raise PyCalcSyntaxError('callable objects with side effects are not allowed')
+                results.append((expression.execute(), None))
+            except Exception as error:
+                results.append((None, error))
+        return results
+
+
+async def handle_connection(evaluator, reader, writer, max_in_flight=128):
+    """
+    Serves JSON lines requests of one connection. Request is object with
+    'expression' and optional 'id' and 'timeout' keys. Response is object
+    with the same 'id' and 'result' with printed result or 'error' with
+    message. Responses are written in order of requests, at most
+    max_in_flight requests are evaluated at once.
+    """
+    responses = asyncio.Queue(max_in_flight)
+
+    async def respond(line):
+        """
+        Returns response object of request line.
+        """
+        try:
+            request = json.loads(line)
+            expr = request['expression']
+        except (ValueError, TypeError, KeyError):
+            return {'error': 'invalid request'}
+        response = {'id': request.get('id')}
+        try:
+            response['result'] = str(await evaluator.evaluate(expr, request.get('timeout')))
+        except asyncio.TimeoutError:
+            response['error'] = 'timeout'
+        except Exception as error:
+            response['error'] = get_error_message(error)
+        return response
+
+    async def write_responses():
+        """
+        Writes responses in order of requests.
+        """
+        while True:
+            task = await responses.get()
+            if task is None:
+                return
+            writer.write(json.dumps(await task).encode() + b'\n')
+            await writer.drain()
+
+    writing = asyncio.get_running_loop().create_task(write_responses())
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                await responses.put(asyncio.ensure_future(respond(line)))
+        await responses.put(None)
+        await writing
+    finally:
+        writing.cancel()
+        writer.close()
+
+
+async def serve(host='127.0.0.1', port=8765, modules=('builtins', 'math'), unrestricted=False, **options):
+    """
+    Runs TCP JSON lines server until it is cancelled.
+
+    TCP server is not authenticated: any local user, or anyone who can
+    reach host, may send expressions. So by default only expressions whose
+    operators and callable objects are pure are evaluated. With
+    unrestricted=True every callable object of modules is allowed,
+    including exec, open and __import__ of builtins, which gives every
+    client code execution as the user running the server.
+
+    Optional keyword arguments:
+        host: address to listen on
+        port: port to listen on
+        modules: names of modules with callable objects and constants
+        unrestricted: if True, callable objects which are not pure are
+            allowed too
+        options: keyword arguments of AsyncEvaluator
+    """
+    scope = ModulesScope(*modules, module_loader=partial(ModuleLoader, snapshot=ScopeSnapshot()))
+    async with AsyncEvaluator(scope, pure_only=not unrestricted, **options) as evaluator:
+        server = await asyncio.start_server(partial(handle_connection, evaluator), host, port)
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,117 @@
+"""
+This module provides evaluation of many expressions line by line with one
+shared scope and parse cache.
+"""
+from collections import namedtuple
+
+from pycalc.exceptions import get_error_message
+from pycalc.parsecache import ExpressionCache
+
+BatchResult = namedtuple('BatchResult', 'line_number expression value error')
+
+
+def read_expressions(lines, start=1):
+    """
+    Yields tuples of line number and expression string without line
+    break and surrounding whitespace.
+
+    Positional arguments:
+        lines: iterable of lines, e.g. opened file
+
+    Optional keyword arguments:
+        start: number of the first line
+    """
+    for line_number, line in enumerate(lines, start):
+        yield line_number, line.strip()
+
+
+def evaluate_lines(lines, scope=None, cache=None, start=1, limits=None):
+    """
+    Yields BatchResult for every line. Errors of single expressions, of any
+    kind, are returned in results instead of being raised, so one failing
+    line does not stop the batch. Empty lines are yielded
+    with None value and error.
+
+    Positional arguments:
+        lines: iterable of lines with one expression per line
+
+    Optional keyword arguments:
+        scope: ModulesScope with callable objects and constants
+        cache: ExpressionCache, new one by default
+        start: number of the first line
+        limits: EvaluationLimits of every expression
+    """
+    if cache is None:
+        cache = ExpressionCache()
+    for line_number, expr in read_expressions(lines, start):
+        if not expr:
+            yield BatchResult(line_number, expr, None, None)
+            continue
+        try:
+            value = cache.get(expr, scope=scope, limits=limits).execute()
+        except Exception as error:
+            yield BatchResult(line_number, expr, None, get_error_message(error))
+        else:
+            yield BatchResult(line_number, expr, value, None)
+
+
+def to_text(result):
+    """
+    Returns BatchResult with value converted to str, or with error message
+    if value can not be converted, e.g. too long integer.
+    """
+    if result.error is not None or not result.expression or type(result.value) is str:
+        return result
+    try:
+        return result._replace(value=str(result.value))
+    except Exception as error:
+        return result._replace(value=None, error=get_error_message(error))
+
+
+def format_result(result):
+    """
+    Returns output line of BatchResult.
+    """
+    if result.error is not None:
+        return 'ERROR: {}'.format(result.error)
+    if not result.expression:
+        return ''
+    return str(result.value)
+
+
+def write_results(results, output):
+    """
+    Writes BatchResults to output as they are produced, one line per
+    result. Output is not flushed after every line, so it is buffered by
+    output stream. Returns number of errors.
+
+    Positional arguments:
+        results: iterable of BatchResult
+        output: text stream to write results to
+    """
+    errors = 0
+    write = output.write
+    for result in results:
+        result = to_text(result)
+        if result.error is not None:
+            errors += 1
+        write(format_result(result))
+        write('\n')
+    return errors
+
+
+def run_batch(lines, output, scope=None, cache=None, limits=None):
+    """
+    Writes results of expressions from lines to output as they are
+    evaluated, one line per input line. Returns number of errors.
+
+    Positional arguments:
+        lines: iterable of lines with one expression per line
+        output: text stream to write results to
+
+    Optional keyword arguments:
+        scope: ModulesScope with callable objects and constants
+        cache: ExpressionCache, new one by default
+        limits: EvaluationLimits of every expression
+    """
+    return write_results(evaluate_lines(lines, scope=scope, cache=cache, limits=limits), output)
@@ -0,0 +1,126 @@
+"""
+This module provides lowering of expression tree to flat postfix program
+and stack machine to execute it.
+"""
+from array import array
+
+from pycalc.exprtree import Literal, Name, Variable, Unary, Binary, postorder
+from pycalc.memoize import argument_key
+
+LOAD = 0
+UNARY = 1
+BINARY = 2
+CALL = 3
+CALL_NO_ARGUMENTS = 4
+LOAD_VARIABLE = 5
+
+
+class Program:
+    """
+    Flat postfix program: opcodes are stored in bytes, their arguments are
+    indexes in array of unsigned integers pointing to the pool of operands,
+    operator functions and callable objects, or to the values of variables.
+    """
+    __slots__ = ('code', 'arguments', 'pool', 'variables')
+
+    def __init__(self, code, arguments, pool, variables=()):
+        """
+        Positional arguments:
+            code: bytes of opcodes
+            arguments: array of indexes in pool, one per opcode
+            pool: tuple of values and functions used by program
+
+        Optional keyword arguments:
+            variables: tuple of names of variables used by program
+        """
+        self.code = code
+        self.arguments = arguments
+        self.pool = pool
+        self.variables = variables
+
+    def __len__(self):
+        """
+        Returns number of instructions.
+        """
+        return len(self.code)
+
+    def execute(self, values=()):
+        """
+        Runs program on stack machine. Returns result of execution.
+
+        Optional keyword arguments:
+            values: sequence of values of variables in order of self.variables
+        """
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pool = self.pool
+        for opcode, argument in zip(self.code, self.arguments):
+            if opcode == LOAD:
+                push(pool[argument])
+            elif opcode == LOAD_VARIABLE:
+                push(values[argument])
+            elif opcode == BINARY:
+                right = pop()
+                stack[-1] = pool[argument](stack[-1], right)
+            elif opcode == UNARY:
+                stack[-1] = pool[argument](stack[-1])
+            elif opcode == CALL:
+                value = stack[-1]
+                if isinstance(value, tuple):
+                    stack[-1] = pool[argument](*value)
+                else:
+                    stack[-1] = pool[argument](value)
+            else:
+                push(pool[argument]())
+        return stack[0]
+
+
+def lower(tree):
+    """
+    Lowers expression tree into Program.
+
+    Positional arguments:
+        tree: root node of expression tree
+    """
+    code = bytearray()
+    arguments = array('I')
+    pool = []
+    pool_indexes = {}
+    variable_indexes = {}
+
+    def pool_index(obj):
+        """
+        Returns index of obj in pool, equal numbers and the same objects
+        share one slot.
+        """
+        if type(obj) in (int, float, bool):
+            key = argument_key(obj)
+        else:
+            key = id(obj)
+        if key not in pool_indexes:
+            pool_indexes[key] = len(pool)
+            pool.append(obj)
+        return pool_indexes[key]
+
+    for node in postorder(tree):
+        node_type = type(node)
+        if node_type is Literal or node_type is Name:
+            code.append(LOAD)
+            arguments.append(pool_index(node.value))
+        elif node_type is Variable:
+            code.append(LOAD_VARIABLE)
+            arguments.append(variable_indexes.setdefault(node.name, len(variable_indexes)))
+        elif node_type is Binary:
+            code.append(BINARY)
+            arguments.append(pool_index(node.operator.execute))
+        elif node_type is Unary:
+            code.append(UNARY)
+            arguments.append(pool_index(node.operator.unary))
+        elif node.argument is None:
+            code.append(CALL_NO_ARGUMENTS)
+            arguments.append(pool_index(node.callable.execute))
+        else:
+            code.append(CALL)
+            arguments.append(pool_index(node.callable.execute))
+    return Program(bytes(code), arguments, tuple(pool), tuple(variable_indexes))
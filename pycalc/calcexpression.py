@@ -2,16 +2,23 @@
 This module provides expression parsing tools.
 """
 
-from operator import add, sub, mul, truediv, floordiv, mod, lt, le, eq, ne, ge, gt
+import sys
+from operator import add, sub, mul, truediv, floordiv, mod, neg, lt, le, eq, ne, ge, gt, itemgetter
 from collections import namedtuple
-import re
+from collections.abc import Mapping
+from functools import lru_cache
 
-from pycalc.moduleloader import BUILT_INS
+from pycalc.moduleloader import BUILT_INS, NameIndex, register_pure
 from pycalc.exceptions import PyCalcSyntaxError
+from pycalc.exprtree import Literal, Name, Variable, Unary, Binary, Call
+from pycalc.lexer import (
+    Lexer, NUMBER, OPERATOR, CONSTANT, CALLABLE, VARIABLE, BRACKET_LEFT, BRACKET_RIGHT
+)
 
 Operator = namedtuple('Operator', 'pattern execute weight unary')
 
 
+@register_pure
 def comma_operator(left, right):
     """
     Imitates python comma operator. If one of operands is tuple,
@@ -35,9 +42,54 @@ def comma_operator(left, right):
         raise PyCalcSyntaxError('invalid syntax near ","')
 
 
-CONSTANTS = BUILT_INS.get_constants()
+@register_pure
+def identity(value):
+    """
+    Unary plus operator: returns value as is.
+    """
+    return value
+
+
+@lru_cache(maxsize=16)
+def get_unexpected_space_patterns(operator_patterns):
+    """
+    Returns tuple of patterns of operators or digits separated by space,
+    which are not allowed in expression.
+
+    Positional arguments:
+        operator_patterns: tuple of patterns of operators
+    """
+    operator_patterns = list(operator_patterns) + ['!', '=']
+    nun_patterns = [str(integer) for integer in range(10)]
+    nun_patterns.append('.')
+    unexpected_patterns = ['{} {}'.format(pattern1, pattern2)
+                           for pattern1 in operator_patterns
+                           for pattern2 in operator_patterns]
+    unexpected_patterns += ['{} {}'.format(pattern1, pattern2)
+                            for pattern1 in nun_patterns
+                            for pattern2 in nun_patterns]
+    expected_patterns = ['{} {}'.format(pattern1, pattern2)
+                         for pattern1 in ('^', '*', '=', '<', '>', '/')
+                         for pattern2 in ('-', '+')]
+    for pattern in expected_patterns:
+        unexpected_patterns.remove(pattern)
+    return tuple(unexpected_patterns)
+
+
+def __getattr__(name):
+    """
+    Creates CONSTANTS and CALLABLE_OBJECTS lists of builtins on first
+    reference, so importing this module does not introspect builtins.
+    """
+    if name == 'CONSTANTS':
+        value = BUILT_INS.get_constants()
+    elif name == 'CALLABLE_OBJECTS':
+        value = BUILT_INS.get_callable_objects()
+    else:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    globals()[name] = value
+    return value
 
-CALLABLE_OBJECTS = BUILT_INS.get_callable_objects()
 
 OPERATORS = [
     Operator(',', comma_operator, -1, None),
@@ -46,8 +98,8 @@ OPERATORS = [
     Operator('//', floordiv, 9, None),
     Operator('/', truediv, 10, None),
     Operator('%', mod, 8, None),
-    Operator('+', add, 6, lambda x: x),
-    Operator('-', sub, 7, lambda x: -x),
+    Operator('+', add, 6, identity),
+    Operator('-', sub, 7, neg),
     Operator('<=', le, 4, None),
     Operator('<', lt, 5, None),
     Operator('==', eq, 3, None),
@@ -64,11 +116,14 @@ class Expression:
     Generates expression model from string.
     """
 
-    def __init__(self, expr, operators=None, callable_objects=None, constants=None):
+    def __init__(self, expr, operators=None, callable_objects=None, constants=None, scope=None,
+                 optimize=True, limits=None, metrics=None):
         """
         Positional arguments:
             expr: string with python-like (except power operator '^'
                 and syntax of abridged multiplication: '2(3+4)') expression.
+                Names which are neither constants nor callable objects are
+                variables, their values are passed to evaluate().
 
         Optional keyword arguments:
             bracket_left: character of left bracket.
@@ -81,18 +136,43 @@ class Expression:
                 is object with attributes: pattern and execute
             constants: list of constants objects where constant is object
                 with attributes: pattern and execute
+            scope: ModulesScope (builtins by default) used instead of
+                callable_objects and constants, its name indexes are shared
+                by all expressions and resolve names lazily
+            optimize: if True, constant subtrees are evaluated once when
+                expression is lowered to program or function
+            limits: EvaluationLimits checked while expression is compiled
+                and evaluated
+            metrics: MetricsRegistry which records parsing and evaluations
+                of expression, their latencies and errors
         """
         self._bracket_left = '('
         self._bracket_right = ')'
         self._expr = expr
         self._brackets_content_placeholder = '#'
         operators = operators or OPERATORS
-        callable_objects = callable_objects or CALLABLE_OBJECTS
-        constants = constants or CONSTANTS
+        self._scope = scope or BUILT_INS
+        self._callable_objects_list = list(callable_objects) if callable_objects else None
+        self._constants_list = list(constants) if constants else None
+        self._callable_index = None if callable_objects else self._scope.callable_index
+        self._constant_index = None if constants else self._scope.constant_index
         self._operators = sorted(operators, key=lambda x: x.weight)
-        self._callable_objects = list(callable_objects)
-        self._constants = list(constants)
-        self.validate()
+        self._optimize = optimize
+        self._limits = limits
+        self._tree = None
+        self._optimized_tree = None
+        self._program = None
+        self._vectorized_program = None
+        self._function = None
+        self._metrics = metrics
+        try:
+            self.validate()
+        except PyCalcSyntaxError as error:
+            if metrics is not None:
+                from pycalc.metrics import PARSE
+
+                metrics.record_error(PARSE, error)
+            raise
         self._preprocessing()
 
     def _preprocessing(self):
@@ -100,14 +180,340 @@ class Expression:
         Prepares input string for parsing
         """
         self._expr = ''.join(self._expr.split())
-        self._uncover_multiplication()
 
     def execute(self):
         """
         Launches parsing and execution process.
         Returns result of execution.
         """
-        return self._execute(self._expr)
+        return self.evaluate()
+
+    def compile(self):
+        """
+        Parses expression into expression tree. Parsing is done only once,
+        subsequent calls return the same tree.
+        Returns root node of expression tree.
+        """
+        if self._tree is None:
+            if self._metrics is None:
+                self._tree = self._parse()
+            else:
+                from pycalc.metrics import PARSE
+
+                self._tree = self._metrics.call(PARSE, self._parse)
+        return self._tree
+
+    def _parse(self):
+        """
+        Returns expression tree of tokens, checked against limits.
+        """
+        tree = self._compile(self.tokenize())
+        if self._limits is not None:
+            self._limits.check_nodes(tree)
+        return tree
+
+    def optimize(self):
+        """
+        Returns compiled expression tree with constant subtrees folded, or
+        compiled tree as is if expression is created with optimize=False.
+        With limits, operators and callable objects of returned tree check
+        them. Optimization is done only once.
+        """
+        if self._optimized_tree is None:
+            from pycalc.optimizer import optimize as optimize_tree
+
+            tree = self.compile()
+            limits = self._limits
+            if limits is None:
+                self._optimized_tree = optimize_tree(tree) if self._optimize else tree
+            else:
+                with limits.deadline():
+                    tree = optimize_tree(tree, limits) if self._optimize else tree
+                self._optimized_tree = limits.guard(tree)
+        return self._optimized_tree
+
+    def to_program(self):
+        """
+        Lowers compiled expression tree to flat postfix program. Lowering is
+        done only once, subsequent calls return the same program.
+        Returns bytecode.Program.
+        """
+        if self._program is None:
+            from pycalc.bytecode import lower
+
+            self._program = lower(self.optimize())
+        return self._program
+
+    def to_function(self):
+        """
+        Compiles expression tree to native python function. Compilation is
+        done only once, subsequent calls return the same function.
+        Returns function which takes values of variables as positional
+        arguments in order of self.variables. Deadline of limits is not
+        started by the function, only by evaluate().
+        """
+        if self._function is None:
+            from pycalc.codegen import generate_function
+
+            self._function = generate_function(self.optimize())
+        return self._function
+
+    def freeze(self):
+        """
+        Compiles, optimizes and lowers expression.
+        Returns immutable compiled.CompiledExpression which may be evaluated
+        by many threads concurrently.
+        """
+        from pycalc.compiled import CompiledExpression
+
+        return CompiledExpression(self._expr, self.to_program(), self._limits, self._metrics)
+
+    @property
+    def variables(self):
+        """
+        Tuple of names of variables in order of their first appearance.
+        """
+        return self.to_program().variables
+
+    def evaluate(self, bindings=None):
+        """
+        Runs compiled program without any string processing.
+        Returns result of execution.
+
+        If any variable is bound to NumPy array, the whole expression is
+        executed once over arrays with NumPy ufuncs (see vectorize module).
+
+        Optional keyword arguments:
+            bindings: mapping of variable names to their values
+        """
+        program = self.to_program()
+        if self._metrics is None:
+            return self._evaluate(program, bindings)
+        from pycalc.metrics import EVALUATE
+
+        return self._metrics.call(EVALUATE, self._evaluate, program, bindings)
+
+    def _evaluate(self, program, bindings):
+        """
+        Binds values of variables and runs program, vectorized one if any
+        value is NumPy array.
+        """
+        values = self._bind(bindings or {}) if program.variables else ()
+        if values and 'numpy' in sys.modules:
+            from pycalc.vectorize import has_arrays, vectorize
+
+            if has_arrays(values):
+                if self._vectorized_program is None:
+                    self._vectorized_program = vectorize(program)
+                program = self._vectorized_program
+        return self._run(program, values)
+
+    def _run(self, program, values):
+        """
+        Runs program with values of variables, within deadline of limits.
+        """
+        if self._limits is None:
+            return program.execute(values)
+        with self._limits.deadline():
+            return program.execute(values)
+
+    def evaluate_many(self, rows):
+        """
+        Runs compiled program for every row of variables values.
+        Yields results of execution.
+
+        Positional arguments:
+            rows: iterable of mappings of variable names to their values or
+                sequences of values in order of self.variables
+        """
+        program = self.to_program()
+        execute = program.execute
+        limits = self._limits
+        metrics = self._metrics
+        if metrics is not None:
+            from pycalc.metrics import EVALUATE
+        for row in rows:
+            if isinstance(row, Mapping):
+                row = self._bind(row)
+            if metrics is not None:
+                yield metrics.call(EVALUATE, self._run, program, row)
+            elif limits is None:
+                yield execute(row)
+            else:
+                with limits.deadline():
+                    result = execute(row)
+                yield result
+
+    def profile(self, bindings=None):
+        """
+        Tokenizes, parses and evaluates expression tree measuring every
+        phase and every node. Constant subtrees are not folded, so time of
+        every subexpression of the expression string is reported. evaluate()
+        is not affected by profiling.
+        Returns profiler.ProfileReport.
+
+        Optional keyword arguments:
+            bindings: mapping of variable names to their values
+        """
+        from pycalc.profiler import Profiler
+
+        profiler = Profiler()
+        tokens = profiler.phase('tokenize', self.tokenize)
+        tree = profiler.phase('parse', self._compile, tokens)
+        limits = self._limits
+        if limits is None:
+            result = profiler.phase('evaluate', profiler.evaluate, tree, bindings)
+        else:
+            limits.check_nodes(tree)
+            tree = limits.guard(tree)
+            with limits.deadline():
+                result = profiler.phase('evaluate', profiler.evaluate, tree, bindings)
+        return profiler.report(result)
+
+    def _bind(self, bindings):
+        """
+        Returns tuple of values of variables from bindings mapping in order
+        of self.variables.
+        """
+        names = self.variables
+        if not names:
+            return ()
+        try:
+            values = itemgetter(*names)(bindings)
+        except KeyError as error:
+            raise PyCalcSyntaxError('unknown name "{}"'.format(error.args[0]))
+        return values if len(names) > 1 else (values,)
+
+    def tokenize(self):
+        """
+        Returns list of tokens of preprocessed expression.
+        """
+        lexer = Lexer(self._operators, self._get_callable_index(), self._get_constant_index(),
+                      self._bracket_left, self._bracket_right)
+        return lexer.tokenize(self._expr)
+
+    @property
+    def _callable_objects(self):
+        """
+        List of callable objects, taken from scope on first reference.
+        """
+        if self._callable_objects_list is None:
+            self._callable_objects_list = self._scope.get_callable_objects()
+        return self._callable_objects_list
+
+    @property
+    def _constants(self):
+        """
+        List of constants, taken from scope on first reference.
+        """
+        if self._constants_list is None:
+            self._constants_list = self._scope.get_constants()
+        return self._constants_list
+
+    def _get_callable_index(self):
+        """
+        Returns NameIndex of self._callable_objects, builds it once if it
+        was not shared by scope.
+        """
+        if self._callable_index is None:
+            self._callable_index = NameIndex(self._callable_objects)
+        return self._callable_index
+
+    def _get_constant_index(self):
+        """
+        Returns NameIndex of self._constants, builds it once if it was not
+        shared by scope.
+        """
+        if self._constant_index is None:
+            self._constant_index = NameIndex(self._constants)
+        return self._constant_index
+
+    def _compile(self, tokens):
+        """
+        Builds expression tree from tokens with explicit stacks (shunting-yard),
+        so expression size is limited by memory only. Binary operators are
+        ordered by weights of self._operators and are left-associative, unary
+        operators bind tighter than binary ones except right-associative power
+        operator '^'.
+        """
+        binary_operators = [op for op in self._operators if op.pattern != '^']
+        ranks = {op.pattern: rank for rank, op in enumerate(binary_operators)}
+        unary_rank = len(ranks)
+        power_rank = unary_rank + 1
+        nodes = []
+        pending = []
+        expect_operand = True
+        for idx, token in enumerate(tokens):
+            if expect_operand:
+                if token.kind == NUMBER:
+                    nodes.append(Literal(token.value))
+                    expect_operand = False
+                elif token.kind == CONSTANT:
+                    nodes.append(Name(token.value.pattern, token.value.value))
+                    expect_operand = False
+                elif token.kind == VARIABLE:
+                    nodes.append(Variable(token.value))
+                    expect_operand = False
+                elif token.kind == CALLABLE:
+                    if idx + 1 < len(tokens) and tokens[idx + 1].kind == BRACKET_LEFT:
+                        pending.append((CALLABLE, token.value, None))
+                    else:
+                        nodes.append(Call(token.value, None))
+                        expect_operand = False
+                elif token.kind == BRACKET_LEFT:
+                    pending.append((BRACKET_LEFT, None, None))
+                elif token.kind == OPERATOR and token.value.unary:
+                    pending.append((Unary, token.value, unary_rank))
+                else:
+                    self._raise_syntax_error(token)
+            elif token.kind == OPERATOR:
+                if token.value.pattern == '^':
+                    rank = power_rank
+                    while pending and pending[-1][2] is not None and pending[-1][2] > rank:
+                        self._reduce(pending.pop(), nodes)
+                else:
+                    rank = ranks[token.value.pattern]
+                    while pending and pending[-1][2] is not None and pending[-1][2] >= rank:
+                        self._reduce(pending.pop(), nodes)
+                pending.append((Binary, token.value, rank))
+                expect_operand = True
+            elif token.kind == BRACKET_RIGHT:
+                while pending and pending[-1][0] != BRACKET_LEFT:
+                    self._reduce(pending.pop(), nodes)
+                if not pending:
+                    raise PyCalcSyntaxError('invalid brackets are not balanced')
+                pending.pop()
+                if pending and pending[-1][0] == CALLABLE:
+                    nodes.append(Call(pending.pop()[1], nodes.pop()))
+            else:
+                self._raise_syntax_error(token)
+        if expect_operand:
+            self._raise_syntax_error()
+        while pending:
+            if pending[-1][0] == BRACKET_LEFT:
+                raise PyCalcSyntaxError('invalid brackets are not balanced')
+            self._reduce(pending.pop(), nodes)
+        return nodes[0]
+
+    @staticmethod
+    def _reduce(pending_operator, nodes):
+        """
+        Replaces operands on top of nodes stack with operator node.
+        """
+        node_type, operator, _ = pending_operator
+        if node_type is Unary:
+            nodes.append(Unary(operator, nodes.pop()))
+        else:
+            right = nodes.pop()
+            nodes.append(Binary(operator, nodes.pop(), right))
+
+    def _raise_syntax_error(self, token=None):
+        """
+        Raises syntax error pointing to token or to the end of expression.
+        """
+        if token is None:
+            raise PyCalcSyntaxError('unexpected end of expression "{}"'.format(self._expr))
+        raise PyCalcSyntaxError('invalid syntax near "{}"'.format(self._expr[token.position:]))
 
     def _execute(self, expr):
         """
@@ -120,7 +526,7 @@ class Expression:
         if result is not None:
             return result
 
-        result = self._get_object(expr, self._constants)
+        result = self._get_constant_index().get(expr)
         if result is not None:
             return result.value
 
@@ -189,7 +595,10 @@ class Expression:
             right = expr[callable_idx[1]:]
             if left and not self._get_min_weight_unary_operator(left):
                 PyCalcSyntaxError('invalid syntax near callable object "{}"'.format(clb.pattern))
-            clb = self._get_object(clb, self._callable_objects, filter_)
+            if filter_:
+                clb = self._get_object(clb, self._callable_objects, filter_)
+            else:
+                clb = self._get_callable_index().get(clb)
             if right != '':
                 res = self._execute(right)
                 if isinstance(res, tuple):
@@ -216,22 +625,10 @@ class Expression:
         """
         Verifies that the expression is not contains unexpected spaces.
         """
-        operator_patterns = [operator.pattern for operator in self._operators]
-        operator_patterns += ['!', '=']
-        nun_patterns = [str(integer) for integer in range(10)]
-        nun_patterns.append('.')
-        unexpected_patterns = ['{} {}'.format(pattern1, pattern2)
-                               for pattern1 in operator_patterns
-                               for pattern2 in operator_patterns]
-        unexpected_patterns += ['{} {}'.format(pattern1, pattern2)
-                                for pattern1 in nun_patterns
-                                for pattern2 in nun_patterns]
-        expected_patterns = ['{} {}'.format(pattern1, pattern2)
-                             for pattern1 in ('^', '*', '=', '<', '>', '/')
-                             for pattern2 in ('-', '+')]
-        for pattern in expected_patterns:
-            unexpected_patterns.remove(pattern)
-        for unexpected_pattern in unexpected_patterns:
+        if ' ' not in self._expr:
+            return
+        operator_patterns = tuple(operator.pattern for operator in self._operators)
+        for unexpected_pattern in get_unexpected_space_patterns(operator_patterns):
             if unexpected_pattern in self._expr:
                 raise PyCalcSyntaxError('unexpected space: "{}"'.format(unexpected_pattern))
 
@@ -351,15 +748,23 @@ class Expression:
         Optional keyword arguments:
             filter_: filter function what be applied to the callable objects list
         """
-        callable_objects = self._callable_objects
         if filter_:
-            callable_objects = filter(filter_, callable_objects)
-        for clb in callable_objects:
-            if clb.pattern in expr:
-                idx0 = expr.find(clb.pattern)
-                idx1 = idx0 + len(clb.pattern)
-                return idx0, idx1
-        return None
+            for clb in filter(filter_, self._callable_objects):
+                if clb.pattern in expr:
+                    idx0 = expr.find(clb.pattern)
+                    idx1 = idx0 + len(clb.pattern)
+                    return idx0, idx1
+            return None
+        index = self._get_callable_index()
+        result = None
+        min_rank = len(index)
+        for idx0 in range(len(expr)):
+            for clb in index.matches(expr, idx0):
+                rank = index.rank(clb.pattern)
+                if rank < min_rank:
+                    min_rank = rank
+                    result = idx0, idx0 + len(clb.pattern)
+        return result
 
     @staticmethod
     def _get_object(pattern, objects, filter_=None):
@@ -410,29 +815,3 @@ class Expression:
             if expr.startswith(operator.pattern):
                 return operator.pattern
         return None
-
-    def _uncover_multiplication(self):
-        """
-        Uncovers shortened multiplication in self._expr.
-
-        Example: '2(2+2)' -> '2*(2+2)'
-        """
-        regular_expression_1 = r'[\W](\d*\.?\d+?\{})'
-        regular_expression_2 = r'^(\d*\.?\d+?\{})'
-
-        for regular_expression in regular_expression_1, regular_expression_2:
-            bracket = self._bracket_left
-            match_list = re.findall(regular_expression.format(bracket), self._expr)
-            for match in match_list:
-                replacer = ''.join((match[:-1], '*', match[-1]))
-                self._expr = self._expr.replace(match, replacer)
-
-            reversed_expr = self._expr[::-1]
-
-            bracket = self._bracket_right
-            match_list = re.findall(regular_expression.format(bracket), reversed_expr)
-            for match in match_list:
-                replacer = ''.join((match[:-1], '*', match[-1]))
-                reversed_expr = reversed_expr.replace(match, replacer)
-
-            self._expr = reversed_expr[::-1]
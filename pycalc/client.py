@@ -0,0 +1,90 @@
+"""
+Provides thin command line client, which forwards expression to running
+pycalc daemon and falls back to evaluation in process when daemon is not
+running. Imports only the standard modules needed to talk to daemon, and
+only when daemon socket exists.
+"""
+import os
+import sys
+
+CONNECT_TIMEOUT = 1.0
+READ_TIMEOUT = 30.0
+
+
+def default_socket_path():
+    """
+    Returns path of daemon socket: $PYCALC_SOCKET, or pycalc.sock in
+    $XDG_RUNTIME_DIR, or user specific socket in /tmp.
+    """
+    path = os.environ.get('PYCALC_SOCKET')
+    if path:
+        return path
+    runtime_directory = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_directory:
+        return os.path.join(runtime_directory, 'pycalc.sock')
+    return '/tmp/pycalc-{}.sock'.format(os.getuid())
+
+
+def forward(expr, modules, path=None):
+    """
+    Sends expression to daemon. Returns response dict with 'result' or
+    'error' key, or None if daemon is not running, can not evaluate
+    expression or does not respond within READ_TIMEOUT seconds.
+
+    Positional arguments:
+        expr: expression string
+        modules: list of names of modules
+
+    Optional keyword arguments:
+        path: path of daemon socket, default_socket_path() by default
+    """
+    path = path or default_socket_path()
+    if not os.path.exists(path):
+        return None
+    import json
+    import socket
+
+    request = json.dumps({'expression': expr, 'modules': list(modules)}).encode() + b'\n'
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(CONNECT_TIMEOUT)
+            connection.connect(path)
+            connection.settimeout(READ_TIMEOUT)
+            connection.sendall(request)
+            with connection.makefile('rb') as response_file:
+                response = json.loads(response_file.readline())
+    except (OSError, ValueError):
+        return None
+    if 'result' in response or 'error' in response:
+        return response
+    return None
+
+
+def print_response(response):
+    """
+    Prints result or error of daemon response as pycalc does. Exits with
+    status 2 on error.
+    """
+    if 'error' in response:
+        print("ERROR: {}".format(response['error']))
+        sys.exit(2)
+    print(response['result'])
+
+
+def main():
+    """
+    Entry point of pycalc command. Single expression argument is forwarded
+    to daemon, everything else is handled by pycalc.__main__.main.
+    """
+    arguments = sys.argv[1:]
+    if len(arguments) == 1 and not arguments[0].startswith('-'):
+        response = forward(arguments[0], ['builtins', 'math'])
+        if response is not None:
+            print_response(response)
+            return
+    from pycalc.__main__ import main as pycalc_main
+    pycalc_main()
+
+
+if __name__ == '__main__':
+    main()
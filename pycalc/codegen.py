@@ -0,0 +1,196 @@
+"""
+This module provides generation of native python functions from
+expression trees.
+"""
+import math
+from collections import namedtuple
+from operator import add, sub, mul, truediv, floordiv, mod, neg, lt, le, eq, ne, ge, gt
+
+from pycalc.exprtree import Literal, Name, Variable, Unary, Binary, postorder, variables
+
+BINARY_OPERATORS = {
+    add: '+', sub: '-', mul: '*', truediv: '/', floordiv: '//', mod: '%', pow: '**',
+    lt: '<', le: '<=', eq: '==', ne: '!=', ge: '>=', gt: '>',
+}
+
+TUPLE_OPERATORS = {add, mul, mod}
+
+MAX_DEPTH = 32
+
+FACTORY_NAME = '_pycalc_factory'
+FUNCTION_NAME = 'pycalc_expression'
+
+Fragment = namedtuple('Fragment', 'source tuple_like depth arguments')
+
+
+def unpack(value):
+    """
+    Returns value if it is tuple else tuple with single value.
+    """
+    if isinstance(value, tuple):
+        return value
+    return (value,)
+
+
+class SourceGenerator:
+    """
+    Generates source of python function from expression tree. Operators are
+    mapped to python operators, everything else is bound as closure constant.
+    Fragments deeper than MAX_DEPTH are assigned to temporary variables, so
+    tree depth is not limited by python parser.
+    """
+
+    def __init__(self, tree):
+        """
+        Positional arguments:
+            tree: root node of expression tree
+        """
+        self._tree = tree
+        self._variables = variables(tree)
+        self._parameters = {name: '_v{}'.format(idx) for idx, name in enumerate(self._variables)}
+        self._closure = {}
+        self._lines = []
+        self._temporaries = 0
+
+    def generate(self):
+        """
+        Returns tuple of source of function factory and list of closure values
+        to be passed to factory.
+        """
+        from pycalc.calcexpression import comma_operator
+
+        fragments = []
+        for node in postorder(self._tree):
+            node_type = type(node)
+            if node_type is Literal or node_type is Name:
+                fragment = Fragment(self._literal(node.value), isinstance(node.value, tuple), 0, None)
+            elif node_type is Variable:
+                fragment = Fragment(self._parameters[node.name], True, 0, None)
+            elif node_type is Unary:
+                fragment = self._unary(node.operator.unary, fragments.pop())
+            elif node_type is Binary:
+                right = fragments.pop()
+                left = fragments.pop()
+                if node.operator.execute is comma_operator:
+                    fragment = self._comma(comma_operator, left, right)
+                else:
+                    fragment = self._binary(node.operator.execute, left, right)
+            elif node.argument is None:
+                fragment = Fragment('{}()'.format(self._bind(node.callable.execute)), True, 0, None)
+            else:
+                fragment = self._call(node.callable.execute, fragments.pop())
+            fragments.append(self._spill(fragment))
+
+        closure = list(self._closure.values())
+        source = '\n'.join([
+            'def {}({}):'.format(FACTORY_NAME, ', '.join(name for name, _ in closure)),
+            '    def {}({}):'.format(FUNCTION_NAME, ', '.join(self._parameters.values())),
+        ] + ['        {}'.format(line) for line in self._lines] + [
+            '        return {}'.format(fragments[0].source),
+            '    return {}'.format(FUNCTION_NAME),
+        ])
+        return source, [value for _, value in closure]
+
+    def _bind(self, value):
+        """
+        Returns name of closure constant bound to value.
+        """
+        key = id(value)
+        if key not in self._closure:
+            self._closure[key] = ('_c{}'.format(len(self._closure)), value)
+        return self._closure[key][0]
+
+    def _temporary(self):
+        """
+        Returns name of new temporary variable.
+        """
+        self._temporaries += 1
+        return '_t{}'.format(self._temporaries - 1)
+
+    def _literal(self, value):
+        """
+        Returns source of constant value. Finite floats and integers up to
+        64 bits are inlined.
+        """
+        value_type = type(value)
+        if (value_type is bool or (value_type is int and value.bit_length() <= 64)
+                or (value_type is float and math.isfinite(value))):
+            source = repr(value)
+            return '({})'.format(source) if source.startswith('-') else source
+        return self._bind(value)
+
+    def _unary(self, func, operand):
+        """
+        Returns fragment of unary operator.
+        """
+        if func is neg:
+            return Fragment('(-{})'.format(operand.source), False, operand.depth + 1, None)
+        source = '{}({})'.format(self._bind(func), operand.source)
+        return Fragment(source, True, operand.depth + 1, None)
+
+    def _binary(self, func, left, right):
+        """
+        Returns fragment of binary operator.
+        """
+        depth = max(left.depth, right.depth) + 1
+        if func in BINARY_OPERATORS:
+            source = '({} {} {})'.format(left.source, BINARY_OPERATORS[func], right.source)
+            tuple_like = func in TUPLE_OPERATORS and (left.tuple_like or right.tuple_like)
+            return Fragment(source, tuple_like, depth, None)
+        source = '{}({}, {})'.format(self._bind(func), left.source, right.source)
+        return Fragment(source, True, depth, None)
+
+    def _comma(self, func, left, right):
+        """
+        Returns fragment of comma operator. Its operands are kept to be passed
+        to callable object as separate arguments.
+        """
+        depth = max(left.depth, right.depth) + 1
+        source = '{}({}, {})'.format(self._bind(func), left.source, right.source)
+        arguments = (left.arguments or (left,)) + (right.arguments or (right,))
+        return Fragment(source, True, depth, arguments)
+
+    def _call(self, func, argument):
+        """
+        Returns fragment of callable object called with argument. Tuple
+        arguments are unpacked.
+        """
+        name = self._bind(func)
+        depth = argument.depth + 1
+        if argument.arguments is not None:
+            sources = [
+                '*{}({})'.format(self._bind(unpack), arg.source) if arg.tuple_like else arg.source
+                for arg in argument.arguments
+            ]
+            return Fragment('{}({})'.format(name, ', '.join(sources)), True, depth, None)
+        if not argument.tuple_like:
+            return Fragment('{}({})'.format(name, argument.source), True, depth, None)
+        temporary = self._temporary()
+        source = '({name}(*{tmp}) if isinstance({tmp} := {arg}, tuple) else {name}({tmp}))'.format(
+            name=name, tmp=temporary, arg=argument.source
+        )
+        return Fragment(source, True, depth, None)
+
+    def _spill(self, fragment):
+        """
+        Assigns too deep fragment to temporary variable.
+        """
+        if fragment.depth < MAX_DEPTH:
+            return fragment
+        temporary = self._temporary()
+        self._lines.append('{} = {}'.format(temporary, fragment.source))
+        return Fragment(temporary, fragment.tuple_like, 0, None)
+
+
+def generate_function(tree):
+    """
+    Compiles expression tree into python function. Positional parameters of
+    function are values of variables in order of their first appearance.
+
+    Positional arguments:
+        tree: root node of expression tree
+    """
+    source, closure = SourceGenerator(tree).generate()
+    namespace = {}
+    exec(compile(source, '<pycalc>', 'exec'), namespace)
+    return namespace[FACTORY_NAME](*closure)
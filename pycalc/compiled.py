@@ -0,0 +1,144 @@
+"""
+This module provides immutable compiled expressions which may be shared by
+threads and evaluated concurrently without locks.
+"""
+from collections.abc import Mapping
+from operator import itemgetter
+
+from pycalc.bytecode import Program
+from pycalc.calcexpression import Expression
+from pycalc.exceptions import PyCalcSyntaxError
+from pycalc.metrics import EVALUATE
+from pycalc.vectorize import has_arrays, vectorize
+
+
+class CompiledExpression:
+    """
+    Immutable result of parsing, optimization and lowering of expression.
+    All its state is created on construction and never changed, evaluation
+    uses only local state of the calling thread, so one CompiledExpression
+    may be evaluated by many threads at once.
+    """
+    __slots__ = ('expr', 'program', 'variables', '_getter', '_limits', '_metrics')
+
+    def __init__(self, expr, program, limits=None, metrics=None):
+        """
+        Positional arguments:
+            expr: preprocessed expression string
+            program: bytecode.Program of expression, its arguments are
+                copied to tuple
+
+        Optional keyword arguments:
+            limits: EvaluationLimits of evaluation, program must be lowered
+                from tree guarded by them
+            metrics: MetricsRegistry which records evaluations
+        """
+        names = program.variables
+        setattr_ = super().__setattr__
+        setattr_('expr', expr)
+        setattr_('program', Program(program.code, tuple(program.arguments), program.pool, names))
+        setattr_('variables', names)
+        setattr_('_getter', itemgetter(*names) if names else None)
+        setattr_('_limits', limits)
+        setattr_('_metrics', metrics)
+
+    def __setattr__(self, name, value):
+        """
+        Raises AttributeError: CompiledExpression is immutable.
+        """
+        raise AttributeError('CompiledExpression is immutable')
+
+    def __delattr__(self, name):
+        """
+        Raises AttributeError: CompiledExpression is immutable.
+        """
+        raise AttributeError('CompiledExpression is immutable')
+
+    def __repr__(self):
+        """
+        Returns representation with expression string.
+        """
+        return '{}({!r})'.format(type(self).__name__, self.expr)
+
+    def evaluate(self, bindings=None):
+        """
+        Runs program. Returns result of execution.
+
+        If any variable is bound to NumPy array, program is vectorized for
+        this call (see Expression.evaluate()).
+
+        Optional keyword arguments:
+            bindings: mapping of variable names to their values
+        """
+        if self._metrics is None:
+            return self._evaluate(bindings)
+        return self._metrics.call(EVALUATE, self._evaluate, bindings)
+
+    def evaluate_many(self, rows):
+        """
+        Runs program for every row of variables values.
+        Yields results of execution.
+
+        Positional arguments:
+            rows: iterable of mappings of variable names to their values or
+                sequences of values in order of self.variables
+        """
+        for row in rows:
+            if isinstance(row, Mapping):
+                row = self._bind(row)
+            if self._metrics is None:
+                yield self._run(self.program, row)
+            else:
+                yield self._metrics.call(EVALUATE, self._run, self.program, row)
+
+    def _evaluate(self, bindings):
+        """
+        Binds values of variables and runs program, vectorized one if any
+        value is NumPy array.
+        """
+        program = self.program
+        values = self._bind(bindings or {}) if self.variables else ()
+        if has_arrays(values):
+            program = vectorize(program)
+        return self._run(program, values)
+
+    def _run(self, program, values):
+        """
+        Runs program with values of variables, within deadline of limits.
+        """
+        if self._limits is None:
+            return program.execute(values)
+        with self._limits.deadline():
+            return program.execute(values)
+
+    def _bind(self, bindings):
+        """
+        Returns tuple of values of variables from bindings mapping in order
+        of self.variables.
+        """
+        if self._getter is None:
+            return ()
+        try:
+            values = self._getter(bindings)
+        except KeyError as error:
+            raise PyCalcSyntaxError('unknown name "{}"'.format(error.args[0]))
+        return values if len(self.variables) > 1 else (values,)
+
+
+def compile_expression(expr, operators=None, scope=None, optimize=True, limits=None, metrics=None):
+    """
+    Parses, optimizes and lowers expression. Returns CompiledExpression.
+
+    Positional arguments:
+        expr: expression string
+
+    Optional keyword arguments:
+        operators: list of operators, copied on compilation
+        scope: ModulesScope or FrozenScope with callable objects and
+            constants, FrozenScope is safe to share by compiling threads
+        optimize: if True, constant subtrees are folded
+        limits: EvaluationLimits of compilation and evaluation
+        metrics: MetricsRegistry which records parsing and evaluations
+    """
+    return Expression(expr, operators=operators, scope=scope, optimize=optimize, limits=limits,
+                      metrics=metrics).freeze()
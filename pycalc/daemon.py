@@ -0,0 +1,150 @@
+"""
+This module provides resident evaluation daemon, which keeps warm scopes
+and cache of compiled expressions and serves clients over Unix domain
+socket with JSON lines protocol.
+"""
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+from functools import partial
+
+from pycalc.client import default_socket_path
+from pycalc.exceptions import HANDLED_ERRORS, get_error_message
+from pycalc.moduleloader import ModuleLoader, ModulesScope, is_pure_tree
+from pycalc.parsecache import ExpressionCache
+from pycalc.scopesnapshot import ScopeSnapshot
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles JSON lines requests of one connection.
+    """
+
+    def handle(self):
+        """
+        Writes response line for every request line.
+        """
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                response = {'error': 'invalid request'}
+            else:
+                response = self.server.evaluate(request)
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class EvaluationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server evaluating expressions. Scopes are created once per
+    set of modules, compiled expressions are shared by all connections.
+
+    Request is object with 'expression' and optional 'modules' keys.
+    Response is object with 'result' key with printed result, or 'error'
+    key with message of error, or 'fallback' key if expression should be
+    evaluated by client: it failed with unexpected exception or it calls
+    callable objects which are not pure, e.g. print, input or open, whose
+    side effects belong to the client process.
+    """
+    daemon_threads = True
+
+    def __init__(self, path=None, cache=None, limits=None):
+        """
+        Optional keyword arguments:
+            path: path of socket, default_socket_path() by default
+            cache: ExpressionCache, new one by default
+            limits: EvaluationLimits of every expression
+        """
+        self._limits = limits
+        self.path = path or default_socket_path()
+        self._cache = cache or ExpressionCache()
+        self._scopes = {}
+        self._lock = threading.Lock()
+        remove_stale_socket(self.path)
+        umask = os.umask(0o177)
+        try:
+            super().__init__(self.path, RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def get_scope(self, modules):
+        """
+        Returns ModulesScope of modules, creates it on first call.
+        """
+        key = tuple(modules)
+        with self._lock:
+            scope = self._scopes.get(key)
+            if scope is None:
+                scope = ModulesScope(*key, module_loader=partial(ModuleLoader, snapshot=ScopeSnapshot()))
+                self._scopes[key] = scope
+        return scope
+
+    def evaluate(self, request):
+        """
+        Returns response dict for request dict.
+        """
+        if not isinstance(request, dict) or not isinstance(request.get('expression'), str):
+            return {'error': 'invalid request'}
+        try:
+            scope = self.get_scope(request.get('modules') or ('builtins', 'math'))
+            expression = self._cache.get(request['expression'], scope=scope, limits=self._limits)
+            if not is_pure_tree(expression.compile()):
+                return {'fallback': True}
+            result = expression.execute()
+        except HANDLED_ERRORS as error:
+            return {'error': get_error_message(error)}
+        except Exception:
+            return {'fallback': True}
+        return {'result': str(result)}
+
+    def server_close(self):
+        """
+        Closes server and removes its socket.
+        """
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def remove_stale_socket(path):
+    """
+    Removes socket file left by stopped daemon. Raises OSError if daemon is
+    running.
+    """
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+    raise OSError('pycalc daemon is already running on {}'.format(path))
+
+
+def terminate(signum, frame):
+    """
+    SIGTERM handler: exits, so socket of daemon is removed.
+    """
+    raise SystemExit(0)
+
+
+def serve(path=None, limits=None):
+    """
+    Runs daemon until it is interrupted or terminated.
+
+    Optional keyword arguments:
+        path: path of socket, default_socket_path() by default
+        limits: EvaluationLimits of every expression
+    """
+    signal.signal(signal.SIGTERM, terminate)
+    with EvaluationServer(path, limits=limits) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
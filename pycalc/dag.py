@@ -0,0 +1,206 @@
+"""
+This module provides hash-consed DAG of expressions: structurally identical
+subtrees of many expressions are stored and evaluated once.
+"""
+from pycalc.exceptions import PyCalcSyntaxError
+from pycalc.exprtree import Literal, Name, Variable, Unary, Binary, postorder
+from pycalc.memoize import argument_key
+from pycalc.moduleloader import is_pure
+
+LOAD = 0
+LOAD_VARIABLE = 1
+UNARY = 2
+BINARY = 3
+CALL = 4
+CALL_NO_ARGUMENTS = 5
+
+
+class Failure:
+    """
+    Marks value of node whose evaluation raised error.
+    """
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        """
+        Positional arguments:
+            error: raised exception
+        """
+        self.error = error
+
+
+def value_key(value):
+    """
+    Returns hashable key of literal value. Equal values of different types,
+    e.g. 1 and 1.0, have different keys. Unhashable values are keyed by
+    identity.
+    """
+    if type(value) is tuple:
+        return tuple, tuple(map(value_key, value))
+    key = argument_key(value)
+    try:
+        hash(key)
+    except TypeError:
+        return type(value), id(value)
+    return key
+
+
+class ExpressionDAG:
+    """
+    Interns expression trees into one DAG. Nodes are stored in topological
+    order as tuples of opcode, value or function and indexes of children.
+    Subtrees which are equal by node types, values and functions share one
+    node, unless they call impure functions: such subtrees are evaluated
+    for every occurrence, as in separate expressions.
+    """
+
+    def __init__(self):
+        self._nodes = []
+        self._keys = {}
+        self._roots = []
+        self._variables = {}
+
+    def __len__(self):
+        """
+        Returns number of distinct nodes.
+        """
+        return len(self._nodes)
+
+    @property
+    def roots(self):
+        """
+        Tuple of indexes of root nodes of added expressions.
+        """
+        return tuple(self._roots)
+
+    @property
+    def variables(self):
+        """
+        Tuple of names of variables of all expressions in order of their
+        first appearance.
+        """
+        return tuple(self._variables)
+
+    def _intern(self, key, node, pure):
+        """
+        Returns index of node with key, adds node if there is no such one.
+        Impure nodes are never shared.
+        """
+        if not pure:
+            self._nodes.append(node)
+            return len(self._nodes) - 1
+        index = self._keys.get(key)
+        if index is None:
+            index = len(self._nodes)
+            self._nodes.append(node)
+            self._keys[key] = index
+        return index
+
+    def add(self, expression):
+        """
+        Adds expression to DAG. Returns index of its root node.
+
+        Positional arguments:
+            expression: Expression, its optimized tree is added, or root
+                node of expression tree
+        """
+        tree = expression.optimize() if hasattr(expression, 'optimize') else expression
+        indexes = []
+        purities = []
+        for node in postorder(tree):
+            node_type = type(node)
+            if node_type is Literal or node_type is Name:
+                key = (node_type, value_key(node.value))
+                index = self._intern(key, (LOAD, node.value, 0, 0), True)
+                pure = True
+            elif node_type is Variable:
+                self._variables.setdefault(node.name, None)
+                index = self._intern((Variable, node.name), (LOAD_VARIABLE, node.name, 0, 0), True)
+                pure = True
+            elif node_type is Unary:
+                func = node.operator.unary
+                operand = indexes.pop()
+                pure = purities.pop() and is_pure(func)
+                index = self._intern((UNARY, id(func), operand), (UNARY, func, operand, 0), pure)
+            elif node_type is Binary:
+                func = node.operator.execute
+                right, left = indexes.pop(), indexes.pop()
+                right_pure, left_pure = purities.pop(), purities.pop()
+                pure = left_pure and right_pure and is_pure(func)
+                index = self._intern((BINARY, id(func), left, right), (BINARY, func, left, right), pure)
+            elif node.argument is None:
+                func = node.callable.execute
+                pure = is_pure(func)
+                index = self._intern((CALL_NO_ARGUMENTS, id(func)), (CALL_NO_ARGUMENTS, func, 0, 0), pure)
+            else:
+                func = node.callable.execute
+                argument = indexes.pop()
+                pure = purities.pop() and is_pure(func)
+                index = self._intern((CALL, id(func), argument), (CALL, func, argument, 0), pure)
+            indexes.append(index)
+            purities.append(pure)
+        self._roots.append(indexes[0])
+        return indexes[0]
+
+    def evaluate(self, bindings=None):
+        """
+        Evaluates every distinct node once. Returns list of results of
+        added expressions in order of adding. Raises error of the first
+        failed expression.
+
+        Optional keyword arguments:
+            bindings: mapping of variable names to their values
+        """
+        results = []
+        for value in self.evaluate_all(bindings):
+            if type(value) is Failure:
+                raise value.error
+            results.append(value)
+        return results
+
+    def evaluate_all(self, bindings=None):
+        """
+        Evaluates every distinct node once. Returns list of results of
+        added expressions in order of adding, where result of failed
+        expression is Failure with raised error.
+
+        Optional keyword arguments:
+            bindings: mapping of variable names to their values
+        """
+        bindings = bindings or {}
+        values = []
+        append = values.append
+        for opcode, obj, first, second in self._nodes:
+            if opcode == LOAD:
+                append(obj)
+                continue
+            if opcode == LOAD_VARIABLE:
+                if obj in bindings:
+                    append(bindings[obj])
+                else:
+                    append(Failure(PyCalcSyntaxError('unknown name "{}"'.format(obj))))
+                continue
+            try:
+                if opcode == BINARY:
+                    left, right = values[first], values[second]
+                    if type(left) is Failure:
+                        append(left)
+                    elif type(right) is Failure:
+                        append(right)
+                    else:
+                        append(obj(left, right))
+                elif opcode == CALL_NO_ARGUMENTS:
+                    append(obj())
+                else:
+                    value = values[first]
+                    if type(value) is Failure:
+                        append(value)
+                    elif opcode == UNARY:
+                        append(obj(value))
+                    elif isinstance(value, tuple):
+                        append(obj(*value))
+                    else:
+                        append(obj(value))
+            except Exception as error:
+                append(Failure(error))
+        return [values[root] for root in self._roots]
@@ -15,6 +15,32 @@ class PyCalcSyntaxError(Exception):
         super().__init__(*args, **kwargs)
 
 
+class PyCalcLimitError(PyCalcSyntaxError):
+    """
+    Pycalc exception raised when evaluation exceeds EvaluationLimits.
+    """
+
+
+ERROR_MESSAGES = {
+    ZeroDivisionError: 'zero division error',
+    RecursionError: 'the expression is too long',
+}
+
+HANDLED_ERRORS = (PyCalcSyntaxError, ZeroDivisionError, RecursionError)
+
+
+def get_error_message(error):
+    """
+    Returns message of error to display for end-user.
+    """
+    if isinstance(error, PyCalcSyntaxError):
+        return error.message
+    for error_type, message in ERROR_MESSAGES.items():
+        if isinstance(error, error_type):
+            return message
+    return str(error) or type(error).__name__
+
+
 def exceptions_handler(func):
     """
     Decorator for handling exceptions while pycalc is used as
@@ -28,14 +54,8 @@ def exceptions_handler(func):
         result = ''
         try:
             result = func(*args, **kwargs)
-        except PyCalcSyntaxError as error:
-            print("ERROR: {}".format(error.message))
-            sys.exit(2)
-        except ZeroDivisionError:
-            print("ERROR: zero division error")
-            sys.exit(2)
-        except RecursionError:
-            print("ERROR: the expression is too long")
+        except HANDLED_ERRORS as error:
+            print("ERROR: {}".format(get_error_message(error)))
             sys.exit(2)
         return result
     return wrapper
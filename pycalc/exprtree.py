@@ -0,0 +1,99 @@
+"""
+This module provides expression tree nodes and tree evaluation.
+"""
+from collections import namedtuple
+
+Literal = namedtuple('Literal', 'value')
+Name = namedtuple('Name', 'pattern value')
+Variable = namedtuple('Variable', 'name')
+Unary = namedtuple('Unary', 'operator operand')
+Binary = namedtuple('Binary', 'operator left right')
+Call = namedtuple('Call', 'callable argument')
+
+
+def children(node):
+    """
+    Returns tuple of child nodes of node.
+    """
+    node_type = type(node)
+    if node_type is Binary:
+        return node.left, node.right
+    if node_type is Unary:
+        return (node.operand,)
+    if node_type is Call and node.argument is not None:
+        return (node.argument,)
+    return ()
+
+
+def postorder(node):
+    """
+    Yields nodes of expression tree in postorder. Uses explicit stack instead
+    of recursion, so tree depth is limited by memory only.
+
+    Positional arguments:
+        node: root node of expression tree
+    """
+    stack = [(node, False)]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        node, expanded = pop()
+        if expanded:
+            yield node
+            continue
+        node_type = type(node)
+        if node_type is Binary:
+            push((node, True))
+            push((node.right, False))
+            push((node.left, False))
+        elif node_type is Unary:
+            push((node, True))
+            push((node.operand, False))
+        elif node_type is Call and node.argument is not None:
+            push((node, True))
+            push((node.argument, False))
+        else:
+            yield node
+
+
+def variables(node):
+    """
+    Returns tuple of names of variables of expression tree in order of their
+    first appearance.
+    """
+    names = {}
+    for child in postorder(node):
+        if type(child) is Variable:
+            names.setdefault(child.name, None)
+    return tuple(names)
+
+
+def evaluate(node, bindings=None):
+    """
+    Walks expression tree and returns result of execution.
+
+    Positional arguments:
+        node: root node of expression tree
+
+    Optional keyword arguments:
+        bindings: mapping of variable names to their values
+    """
+    values = []
+    for node in postorder(node):
+        node_type = type(node)
+        if node_type is Literal or node_type is Name:
+            values.append(node.value)
+        elif node_type is Variable:
+            values.append(bindings[node.name])
+        elif node_type is Binary:
+            right = values.pop()
+            values[-1] = node.operator.execute(values[-1], right)
+        elif node_type is Unary:
+            values[-1] = node.operator.unary(values[-1])
+        elif node.argument is None:
+            values.append(node.callable.execute())
+        elif isinstance(values[-1], tuple):
+            values[-1] = node.callable.execute(*values[-1])
+        else:
+            values[-1] = node.callable.execute(values[-1])
+    return values[0]
@@ -0,0 +1,152 @@
+"""
+This module provides single pass tokenizer of expression strings.
+"""
+import re
+from collections import namedtuple
+
+from pycalc.exceptions import PyCalcSyntaxError
+from pycalc.moduleloader import NameIndex, LazyNameIndex
+
+NUMBER = 'number'
+OPERATOR = 'operator'
+CONSTANT = 'constant'
+CALLABLE = 'callable'
+VARIABLE = 'variable'
+BRACKET_LEFT = 'bracket_left'
+BRACKET_RIGHT = 'bracket_right'
+
+Token = namedtuple('Token', 'kind value position')
+
+NUMBER_REGULAR_EXPRESSION = re.compile(r'(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+NAME_REGULAR_EXPRESSION = re.compile(r'[^\W\d]\w*')
+
+
+class Lexer:
+    """
+    Splits expression string into tokens in one pass.
+    """
+
+    def __init__(self, operators, callable_objects, constants, bracket_left='(', bracket_right=')'):
+        """
+        Positional arguments:
+            operators: list of operators where operator is object with
+                attributes: pattern, execute, weight and unary
+            callable_objects: list of callable objects where callable object
+                is object with attributes: pattern and execute, or NameIndex
+                or LazyNameIndex of them
+            constants: list of constants objects where constant is object
+                with attributes: pattern and value, or NameIndex or
+                LazyNameIndex of them
+
+        Optional keyword arguments:
+            bracket_left: character of left bracket.
+            bracket_right: character of right bracket.
+
+        If several objects have the same pattern, the first one is used.
+        """
+        self._bracket_left = bracket_left
+        self._bracket_right = bracket_right
+        self._operators = self._index(operators)
+        self._callable_objects = self._index(callable_objects)
+        self._constants = self._index(constants)
+        self._multiplication = self._operators.get('*')
+
+    @staticmethod
+    def _index(objects):
+        """
+        Returns NameIndex of objects.
+        """
+        if isinstance(objects, (NameIndex, LazyNameIndex)):
+            return objects
+        return NameIndex(objects)
+
+    def tokenize(self, expr):
+        """
+        Returns list of tokens of expr. Shortened multiplication is uncovered
+        by inserting multiplication operator tokens.
+
+        Example: '2(2+2)' -> 2 * ( 2 + 2 )
+        """
+        tokens = []
+        position = 0
+        length = len(expr)
+        while position < length:
+            sym = expr[position]
+            if sym.isspace():
+                position += 1
+            elif sym == self._bracket_left:
+                if tokens and tokens[-1].kind == NUMBER:
+                    self._append_multiplication(tokens, position)
+                tokens.append(Token(BRACKET_LEFT, sym, position))
+                position += 1
+            elif sym == self._bracket_right:
+                tokens.append(Token(BRACKET_RIGHT, sym, position))
+                position += 1
+            elif sym.isdigit() or sym == '.':
+                position = self._tokenize_number(expr, position, tokens)
+            elif sym.isalpha() or sym == '_':
+                position = self._tokenize_name(expr, position, tokens)
+            else:
+                position = self._tokenize_operator(expr, position, tokens)
+        return tokens
+
+    def _tokenize_number(self, expr, position, tokens):
+        """
+        Appends number token to tokens. Returns position after number.
+        """
+        match = NUMBER_REGULAR_EXPRESSION.match(expr, position)
+        if not match:
+            raise PyCalcSyntaxError('invalid syntax near "{}"'.format(expr[position:]))
+        text = match.group()
+        value = int(text) if text.isdigit() else float(text)
+        if tokens and tokens[-1].kind == BRACKET_RIGHT:
+            self._append_multiplication(tokens, position)
+        tokens.append(Token(NUMBER, value, position))
+        return match.end()
+
+    def _tokenize_name(self, expr, position, tokens):
+        """
+        Appends constant, callable object or variable token to tokens. Returns
+        position after name. Unknown names which are not called are variables.
+        """
+        match = NAME_REGULAR_EXPRESSION.match(expr, position)
+        name = match.group()
+        end = match.end()
+        called = expr.startswith(self._bracket_left, end)
+        if called:
+            callable_object = self._callable_objects.get(name)
+            if callable_object is not None:
+                tokens.append(Token(CALLABLE, callable_object, position))
+            elif name in self._constants:
+                raise PyCalcSyntaxError('"{}" is not callable'.format(name))
+            else:
+                raise PyCalcSyntaxError('unknown name "{}"'.format(name))
+            return end
+        constant = self._constants.get(name)
+        if constant is not None:
+            tokens.append(Token(CONSTANT, constant, position))
+            return end
+        callable_object = self._callable_objects.get(name)
+        if callable_object is not None:
+            tokens.append(Token(CALLABLE, callable_object, position))
+        else:
+            tokens.append(Token(VARIABLE, name, position))
+        return end
+
+    def _tokenize_operator(self, expr, position, tokens):
+        """
+        Appends operator token to tokens. Returns position after operator.
+        """
+        operator = self._operators.longest_match(expr, position)
+        if operator is None:
+            raise PyCalcSyntaxError('invalid syntax near "{}"'.format(expr[position:]))
+        tokens.append(Token(OPERATOR, operator, position))
+        return position + len(operator.pattern)
+
+    def _append_multiplication(self, tokens, position):
+        """
+        Appends multiplication operator token for shortened multiplication.
+        """
+        if self._multiplication is None:
+            raise PyCalcSyntaxError('shortened multiplication is not supported')
+        tokens.append(Token(OPERATOR, self._multiplication, position))
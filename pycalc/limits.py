@@ -0,0 +1,274 @@
+"""
+This module provides evaluation limits, which stop pathological
+expressions like '9^9^9^9' before they are computed.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from operator import add, sub, mul
+
+from pycalc.exceptions import PyCalcLimitError
+from pycalc.exprtree import Unary, Binary, Call, postorder
+from pycalc.memoize import unwrap
+
+SEQUENCES = (str, bytes, bytearray, tuple, list)
+
+
+def int_bits(value):
+    """
+    Returns bit length of integer value or 0 for other values.
+    """
+    return value.bit_length() if isinstance(value, int) else 0
+
+
+def check_sum(limits, left, right):
+    """
+    Checks operands of addition and subtraction.
+    """
+    limits.check_bits(max(int_bits(left), int_bits(right)))
+
+
+def check_product(limits, left, right):
+    """
+    Checks operands of multiplication: bit length of integer product or
+    length of repeated sequence.
+    """
+    if isinstance(left, int):
+        if isinstance(right, int):
+            limits.check_bits(left.bit_length() + right.bit_length())
+        elif isinstance(right, SEQUENCES):
+            limits.check_length(len(right) * left)
+    elif isinstance(left, SEQUENCES) and isinstance(right, int):
+        limits.check_length(len(left) * right)
+
+
+def check_power(limits, base, exponent, modulus=None):
+    """
+    Checks operands of power: size of exponent and estimated bit length of
+    result. Modular power of integers is not limited by bit length: it is
+    computed by three-argument pow only for int, not bool, modulus, as in
+    optimizer.power_mod.
+    """
+    if not isinstance(base, int) or not isinstance(exponent, int) or exponent < 0 or abs(base) < 2:
+        return
+    if modulus is not None and type(modulus) is int and modulus:
+        return
+    limits.check_exponent(exponent)
+    limits.check_bits((base.bit_length() - 1) * exponent)
+
+
+def check_factorial(limits, value):
+    """
+    Checks argument of factorial: n! < n^n.
+    """
+    if isinstance(value, int) and value > 1:
+        limits.check_bits(value.bit_length() * value)
+
+
+def check_comb(limits, total, chosen):
+    """
+    Checks arguments of comb: C(n, k) < n^min(k, n-k).
+    """
+    if isinstance(total, int) and isinstance(chosen, int) and 0 <= chosen <= total:
+        limits.check_bits(total.bit_length() * min(chosen, total - chosen))
+
+
+def check_perm(limits, total, chosen=None):
+    """
+    Checks arguments of perm: P(n, k) < n^k.
+    """
+    if chosen is None:
+        chosen = total
+    if isinstance(total, int) and isinstance(chosen, int) and 0 <= chosen <= total:
+        limits.check_bits(total.bit_length() * chosen)
+
+
+def get_checks():
+    """
+    Returns dict of functions and checks of their arguments.
+    """
+    from pycalc.optimizer import power_mod
+    return {
+        add: check_sum,
+        sub: check_sum,
+        mul: check_product,
+        pow: check_power,
+        power_mod: check_power,
+        math.factorial: check_factorial,
+        math.comb: check_comb,
+        math.perm: check_perm,
+    }
+
+
+class GuardedCallable:
+    """
+    Wrapper of operator function or callable object which checks deadline
+    and arguments before calling it and bit length of its integer result.
+    """
+    transparent = True
+
+    def __init__(self, func, limits, check=None):
+        """
+        Positional arguments:
+            func: wrapped function
+            limits: EvaluationLimits
+
+        Optional keyword arguments:
+            check: function which takes limits and arguments of func and
+                raises PyCalcLimitError if func must not be called
+        """
+        self.__wrapped__ = func
+        self._limits = limits
+        self._check = check
+
+    def __call__(self, *args):
+        """
+        Checks limits and calls wrapped function.
+        """
+        self._limits.check_deadline()
+        if self._check is not None:
+            self._check(self._limits, *args)
+        result = self.__wrapped__(*args)
+        if type(result) is int:
+            self._limits.check_bits(result.bit_length())
+        return result
+
+
+class EvaluationLimits:
+    """
+    Limits of expression size and evaluation cost. None means unlimited.
+    Sizes of results of operators and known functions are estimated from
+    operands before operation is computed, integer results of other
+    callable objects are checked after they are returned.
+
+    Deadline is measured from the start of every evaluation and checked
+    before every operator and callable object is called, so it is not a
+    hard wall-clock limit: a single long call like sum(range(10^10)) is not
+    interrupted and evaluation fails only after it returns.
+    """
+
+    def __init__(self, max_nodes=None, max_int_bits=None, max_exponent=None, timeout=None):
+        """
+        Optional keyword arguments:
+            max_nodes: maximal number of nodes of expression tree
+            max_int_bits: maximal bit length of integer results and
+                length of repeated sequences
+            max_exponent: maximal integer exponent of power
+            timeout: maximal evaluation time in seconds
+        """
+        self.max_nodes = max_nodes
+        self.max_int_bits = max_int_bits
+        self.max_exponent = max_exponent
+        self.timeout = timeout
+        self._local = threading.local()
+        self._guards = {}
+        self._guards_lock = threading.Lock()
+
+    def __reduce__(self):
+        """
+        Pickles limits by their values.
+        """
+        return type(self), self.fingerprint
+
+    @property
+    def fingerprint(self):
+        """
+        Tuple of values of limits.
+        """
+        return self.max_nodes, self.max_int_bits, self.max_exponent, self.timeout
+
+    def check_nodes(self, tree):
+        """
+        Raises PyCalcLimitError if tree has too many nodes.
+        """
+        if self.max_nodes is None:
+            return
+        for count, _ in enumerate(postorder(tree), 1):
+            if count > self.max_nodes:
+                raise PyCalcLimitError('expression has more than {} nodes'.format(self.max_nodes))
+
+    def check_bits(self, bits):
+        """
+        Raises PyCalcLimitError if integer of bits length is too large.
+        """
+        if self.max_int_bits is not None and bits > self.max_int_bits:
+            raise PyCalcLimitError('integer result exceeds {} bits'.format(self.max_int_bits))
+
+    def check_length(self, length):
+        """
+        Raises PyCalcLimitError if sequence of length items is too large.
+        Sequence may have as many items as integer result may have bits.
+        """
+        if self.max_int_bits is not None and length > self.max_int_bits:
+            raise PyCalcLimitError('sequence result exceeds {} items'.format(self.max_int_bits))
+
+    def check_exponent(self, exponent):
+        """
+        Raises PyCalcLimitError if exponent is too large.
+        """
+        if self.max_exponent is not None and exponent > self.max_exponent:
+            raise PyCalcLimitError('exponent exceeds {}'.format(self.max_exponent))
+
+    def check_deadline(self):
+        """
+        Raises PyCalcLimitError if deadline of current evaluation is passed.
+        Called between operations, it can not interrupt running one.
+        """
+        deadline = getattr(self._local, 'deadline', None)
+        if deadline is not None and time.monotonic() > deadline:
+            raise PyCalcLimitError('evaluation exceeds {} seconds'.format(self.timeout))
+
+    @contextmanager
+    def deadline(self):
+        """
+        Context manager which starts deadline of evaluation in current
+        thread. Nested evaluations keep the outer deadline.
+        """
+        if self.timeout is None or getattr(self._local, 'deadline', None) is not None:
+            yield
+            return
+        self._local.deadline = time.monotonic() + self.timeout
+        try:
+            yield
+        finally:
+            self._local.deadline = None
+
+    def guard_function(self, func):
+        """
+        Returns GuardedCallable of func, one per function.
+        """
+        try:
+            hash(func)
+        except TypeError:
+            return GuardedCallable(func, self)
+        with self._guards_lock:
+            guard = self._guards.get(func)
+            if guard is None:
+                guard = GuardedCallable(func, self, get_checks().get(unwrap(func)))
+                self._guards[func] = guard
+        return guard
+
+    def guard(self, tree):
+        """
+        Returns tree where all operators and callable objects check limits
+        before they are called.
+
+        Positional arguments:
+            tree: root node of expression tree
+        """
+        nodes = []
+        for node in postorder(tree):
+            node_type = type(node)
+            if node_type is Unary:
+                operator = node.operator._replace(unary=self.guard_function(node.operator.unary))
+                node = Unary(operator, nodes.pop())
+            elif node_type is Binary:
+                right = nodes.pop()
+                operator = node.operator._replace(execute=self.guard_function(node.operator.execute))
+                node = Binary(operator, nodes.pop(), right)
+            elif node_type is Call:
+                clb = node.callable._replace(execute=self.guard_function(node.callable.execute))
+                node = Call(clb, nodes.pop() if node.argument is not None else None)
+            nodes.append(node)
+        return nodes[0]
@@ -0,0 +1,97 @@
+"""
+This module provides memoization of pure callable objects.
+"""
+from collections import OrderedDict, namedtuple
+
+MemoInfo = namedtuple('MemoInfo', 'hits misses size maxsize')
+
+
+def argument_key(value):
+    """
+    Returns hashable key of argument which distinguishes values which are
+    equal but give different results: 1, 1.0 and True, or 0.0 and -0.0.
+    """
+    value_type = type(value)
+    if value_type is float:
+        return value_type, value.hex()
+    if value_type is complex:
+        return value_type, value.real.hex(), value.imag.hex()
+    return value_type, value
+
+
+class MemoizedCallable:
+    """
+    Thread-safe wrapper of pure callable object with bounded LRU cache of
+    results keyed by arguments. Calls with unhashable arguments and calls
+    which raise are not cached.
+    """
+    transparent = True
+
+    def __init__(self, func, maxsize=1024):
+        """
+        Positional arguments:
+            func: pure callable object
+
+        Optional keyword arguments:
+            maxsize: maximal number of cached results
+        """
+        import threading
+
+        self.__wrapped__ = func
+        self.__name__ = '{}.{}'.format(getattr(func, '__module__', None), getattr(func, '__name__', func))
+        self._maxsize = maxsize
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, *args):
+        """
+        Returns cached result of func for args or calls func.
+        """
+        try:
+            key = tuple(map(argument_key, args))
+            hash(key)
+        except TypeError:
+            return self.__wrapped__(*args)
+        with self._lock:
+            try:
+                result = self._results[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return result
+        result = self.__wrapped__(*args)
+        with self._lock:
+            self._results[key] = result
+            if len(self._results) > self._maxsize:
+                self._results.popitem(last=False)
+        return result
+
+    def info(self):
+        """
+        Returns MemoInfo with hits and misses counters and sizes.
+        """
+        with self._lock:
+            return MemoInfo(self.hits, self.misses, len(self._results), self._maxsize)
+
+    def clear(self):
+        """
+        Removes all cached results and resets counters.
+        """
+        with self._lock:
+            self._results.clear()
+            self.hits = self.misses = 0
+
+
+def unwrap(func):
+    """
+    Returns callable object wrapped by transparent wrappers, like
+    MemoizedCallable, or func itself. Transparent wrappers do not change
+    results of wrapped functions.
+    """
+    while getattr(type(func), 'transparent', False):
+        func = func.__wrapped__
+    return func
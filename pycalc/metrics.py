@@ -0,0 +1,173 @@
+"""
+This module provides thread-safe registry of runtime metrics: numbers of
+parsed expressions and evaluations, errors by kind and latency histograms,
+with snapshot and Prometheus text exposition format.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+PARSE = 'parse'
+EVALUATE = 'evaluate'
+
+OPERATIONS = (PARSE, EVALUATE)
+
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+HistogramSnapshot = namedtuple('HistogramSnapshot', 'buckets counts count sum')
+MetricsSnapshot = namedtuple('MetricsSnapshot', 'counters errors histograms')
+
+PROMETHEUS_NAMES = {
+    PARSE: ('expressions_parsed_total', 'parse_duration_seconds', 'Number of parsed expressions.',
+            'Time of tokenizing and parsing of expressions.'),
+    EVALUATE: ('evaluations_total', 'evaluation_duration_seconds', 'Number of evaluations.',
+               'Time of evaluations of compiled expressions.'),
+}
+
+
+class MetricsRegistry:
+    """
+    Counts operations (parse and evaluate) and their errors by kind (name of
+    exception class) and collects histograms of their latencies. All methods
+    may be called from any thread.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, timer=time.perf_counter):
+        """
+        Optional keyword arguments:
+            buckets: sorted upper bounds of histogram buckets in seconds
+            timer: function which returns current time in seconds
+        """
+        self._buckets = tuple(buckets)
+        self.timer = timer
+        self._lock = threading.Lock()
+        self._counts = {operation: [0] * (len(self._buckets) + 1) for operation in OPERATIONS}
+        self._sums = dict.fromkeys(OPERATIONS, 0.0)
+        self._errors = {operation: {} for operation in OPERATIONS}
+
+    def observe(self, operation, seconds, error=None):
+        """
+        Records one operation which took seconds and failed with error if it
+        is given.
+
+        Positional arguments:
+            operation: PARSE or EVALUATE
+            seconds: latency of operation
+        """
+        index = bisect_left(self._buckets, seconds)
+        with self._lock:
+            self._counts[operation][index] += 1
+            self._sums[operation] += seconds
+            if error is not None:
+                errors = self._errors[operation]
+                kind = type(error).__name__
+                errors[kind] = errors.get(kind, 0) + 1
+
+    def record_error(self, operation, error):
+        """
+        Records error of operation which was rejected before it was timed,
+        e.g. by validation of expression string.
+        """
+        kind = type(error).__name__
+        with self._lock:
+            errors = self._errors[operation]
+            errors[kind] = errors.get(kind, 0) + 1
+
+    def call(self, operation, func, *args):
+        """
+        Calls func with args and records operation with its latency and
+        error raised by func, if any. Returns result of func.
+        """
+        timer = self.timer
+        start = timer()
+        try:
+            result = func(*args)
+        except Exception as error:
+            self.observe(operation, timer() - start, error)
+            raise
+        self.observe(operation, timer() - start)
+        return result
+
+    def snapshot(self):
+        """
+        Returns consistent MetricsSnapshot: counters dict of numbers of
+        operations, errors dict of dicts of numbers of errors by kind and
+        histograms dict of HistogramSnapshot with cumulative counts, the last
+        bucket is infinity.
+        """
+        with self._lock:
+            counts = {operation: list(counts) for operation, counts in self._counts.items()}
+            sums = dict(self._sums)
+            errors = {operation: dict(errors) for operation, errors in self._errors.items()}
+        histograms = {}
+        for operation, operation_counts in counts.items():
+            cumulative = []
+            total = 0
+            for count in operation_counts:
+                total += count
+                cumulative.append(total)
+            histograms[operation] = HistogramSnapshot(
+                self._buckets + (float('inf'),), tuple(cumulative), total, sums[operation]
+            )
+        counters = {operation: histogram.count for operation, histogram in histograms.items()}
+        return MetricsSnapshot(counters, errors, histograms)
+
+    def reset(self):
+        """
+        Resets all metrics to zero.
+        """
+        with self._lock:
+            for operation in OPERATIONS:
+                self._counts[operation] = [0] * (len(self._buckets) + 1)
+                self._sums[operation] = 0.0
+                self._errors[operation] = {}
+
+
+def _format_bound(bound):
+    """
+    Returns Prometheus text of bucket upper bound.
+    """
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def to_prometheus(snapshot, prefix='pycalc'):
+    """
+    Returns metrics of MetricsSnapshot in Prometheus text exposition format.
+
+    Positional arguments:
+        snapshot: MetricsSnapshot or MetricsRegistry to take snapshot of
+
+    Optional keyword arguments:
+        prefix: prefix of metric names
+    """
+    if isinstance(snapshot, MetricsRegistry):
+        snapshot = snapshot.snapshot()
+    lines = []
+    for operation in OPERATIONS:
+        counter_name, histogram_name, counter_help, histogram_help = PROMETHEUS_NAMES[operation]
+        counter_name = '{}_{}'.format(prefix, counter_name)
+        histogram_name = '{}_{}'.format(prefix, histogram_name)
+        histogram = snapshot.histograms[operation]
+        lines += [
+            '# HELP {} {}'.format(counter_name, counter_help),
+            '# TYPE {} counter'.format(counter_name),
+            '{} {}'.format(counter_name, snapshot.counters[operation]),
+            '# HELP {} {}'.format(histogram_name, histogram_help),
+            '# TYPE {} histogram'.format(histogram_name),
+        ]
+        lines += ['{}_bucket{{le="{}"}} {}'.format(histogram_name, _format_bound(bound), count)
+                  for bound, count in zip(histogram.buckets, histogram.counts)]
+        lines += [
+            '{}_sum {}'.format(histogram_name, repr(histogram.sum)),
+            '{}_count {}'.format(histogram_name, histogram.count),
+        ]
+    errors_name = '{}_errors_total'.format(prefix)
+    lines += [
+        '# HELP {} Number of errors by operation and kind.'.format(errors_name),
+        '# TYPE {} counter'.format(errors_name),
+    ]
+    for operation in OPERATIONS:
+        for kind, count in sorted(snapshot.errors[operation].items()):
+            lines.append('{}{{operation="{}",kind="{}"}} {}'.format(errors_name, operation, kind, count))
+    return '\n'.join(lines) + '\n'
@@ -1,23 +1,250 @@
 """
 This module provides dynamic import functionality.
 """
+import sys
 from collections import namedtuple
 
+from pycalc.exprtree import Unary, Binary, Call, postorder
+from pycalc.memoize import MemoizedCallable, unwrap
+from pycalc.scopesnapshot import ModuleNames
+
 Callable = namedtuple('Callable', 'pattern execute')
 Constant = namedtuple('Constant', 'pattern value')
 
+_MISSING = object()
+
+PURE_MODULES = {
+    'builtins': frozenset((
+        'abs', 'all', 'any', 'bin', 'bool', 'chr', 'complex', 'divmod', 'float', 'hex',
+        'int', 'len', 'max', 'min', 'oct', 'ord', 'pow', 'round', 'str', 'sum',
+    )),
+    'math': None,
+    'cmath': None,
+    '_operator': frozenset((
+        'add', 'sub', 'mul', 'truediv', 'floordiv', 'mod', 'pow', 'neg', 'pos', 'abs',
+        'lt', 'le', 'eq', 'ne', 'ge', 'gt',
+    )),
+}
+
+_PURE_CALLABLES = set()
+
+
+def register_pure(func):
+    """
+    Registers func as pure: it has no side effects and its result depends
+    on arguments only, so its calls with constant arguments may be
+    evaluated once. Returns func, so it can be used as decorator.
+    """
+    _PURE_CALLABLES.add(func)
+    return func
+
+
+def is_pure(func):
+    """
+    Returns True if func is registered as pure or it is one of pure
+    functions of PURE_MODULES, e.g. math functions, abs or round. Functions
+    like input or print are not pure. Does not import any module.
+    Memoized callable objects are pure if their functions are pure.
+    """
+    func = unwrap(func)
+    try:
+        if func in _PURE_CALLABLES:
+            return True
+    except TypeError:
+        return False
+    module_name = getattr(func, '__module__', None)
+    name = getattr(func, '__name__', None)
+    if module_name not in PURE_MODULES or name is None:
+        return False
+    names = PURE_MODULES[module_name]
+    if names is not None and name not in names:
+        return False
+    module = sys.modules.get(module_name)
+    return module is not None and getattr(module, name, None) is func
+
+
+def is_pure_tree(tree):
+    """
+    Returns True if all operators and callable objects of expression tree
+    are pure, so its evaluation has no side effects like printing, reading
+    input or opening files.
+    """
+    for node in postorder(tree):
+        node_type = type(node)
+        if node_type is Call:
+            func = node.callable.execute
+        elif node_type is Binary:
+            func = node.operator.execute
+        elif node_type is Unary:
+            func = node.operator.unary
+        else:
+            continue
+        if not is_pure(func):
+            return False
+    return True
+
+
+class NameIndex:
+    """
+    Index of objects with pattern attribute: dict for exact lookup and
+    prefix trie for longest-match scanning. If several objects have the same
+    pattern, the first one is indexed.
+    """
+    def __init__(self, objects):
+        """
+        Positional arguments:
+            objects: iterable of objects with pattern attribute
+        """
+        self._objects = {}
+        self._ranks = {}
+        self._trie = {}
+        for obj in objects:
+            if obj.pattern in self._objects:
+                continue
+            self._ranks[obj.pattern] = len(self._objects)
+            self._objects[obj.pattern] = obj
+            node = self._trie
+            for sym in obj.pattern:
+                node = node.setdefault(sym, {})
+            node[''] = obj
+
+    def __contains__(self, pattern):
+        """
+        Returns True if object with pattern is indexed.
+        """
+        return pattern in self._objects
+
+    def __len__(self):
+        """
+        Returns number of indexed objects.
+        """
+        return len(self._objects)
+
+    def get(self, pattern, default=None):
+        """
+        Returns object with pattern or default.
+        """
+        return self._objects.get(pattern, default)
+
+    def rank(self, pattern):
+        """
+        Returns position of object with pattern in original objects order.
+        """
+        return self._ranks[pattern]
+
+    def matches(self, text, start=0):
+        """
+        Yields objects which patterns text has at start position, shortest
+        first. Takes time proportional to the longest pattern length only.
+        """
+        node = self._trie
+        for idx in range(start, len(text)):
+            node = node.get(text[idx])
+            if node is None:
+                return
+            if '' in node:
+                yield node['']
+
+    def longest_match(self, text, start=0):
+        """
+        Returns object with the longest pattern which text has at start
+        position, or None.
+        """
+        match = None
+        for match in self.matches(text, start):
+            pass
+        return match
+
+
+class LazyNameIndex:
+    """
+    NameIndex-like view which resolves names on first reference and caches
+    them. Full NameIndex of all objects is built only when trie scanning,
+    ranks or size are needed.
+    """
+    def __init__(self, resolve, get_objects):
+        """
+        Positional arguments:
+            resolve: function which returns object by pattern or None
+            get_objects: function which returns list of all objects
+        """
+        self._resolve = resolve
+        self._get_objects = get_objects
+        self._resolved = {}
+        self._index = None
+
+    def __contains__(self, pattern):
+        """
+        Returns True if object with pattern exists.
+        """
+        return self.get(pattern) is not None
+
+    def __len__(self):
+        """
+        Returns number of all objects.
+        """
+        return len(self._get_index())
+
+    def get(self, pattern, default=None):
+        """
+        Returns object with pattern or default.
+        """
+        try:
+            obj = self._resolved[pattern]
+        except KeyError:
+            obj = self._resolved[pattern] = self._resolve(pattern)
+        return default if obj is None else obj
+
+    def rank(self, pattern):
+        """
+        Returns position of object with pattern in all objects order.
+        """
+        return self._get_index().rank(pattern)
+
+    def matches(self, text, start=0):
+        """
+        Yields objects which patterns text has at start position.
+        """
+        return self._get_index().matches(text, start)
+
+    def longest_match(self, text, start=0):
+        """
+        Returns object with the longest pattern which text has at start
+        position, or None.
+        """
+        return self._get_index().longest_match(text, start)
+
+    def _get_index(self):
+        """
+        Returns NameIndex of all objects, builds it on first call.
+        """
+        if self._index is None:
+            self._index = NameIndex(self._get_objects())
+        return self._index
+
 
 class ModuleLoader:
     """
     Provides access to constants and callable objects of corresponding module.
+    Module is imported on first reference to any of its names, and its
+    namespace is introspected only when lists of all names are requested.
+
+    With ScopeSnapshot, names of module are known without importing it, so
+    module is imported only when one of its names is used.
     """
-    def __init__(self, module, callable_constructor=Callable, constant_constructor=Constant):
+    def __init__(self, module, callable_constructor=Callable, constant_constructor=Constant,
+                 snapshot=None):
+        self._snapshot = snapshot
+        self._names = None
         self._callable_constructor = callable_constructor
         self._constant_constructor = constant_constructor
         self._callable_objects = []
         self._constants = []
+        self._module_name = module
         self._module = None
-        self.load_module(module)
+        self._loaded = False
+        self._constant_index = LazyNameIndex(self._get_constant, self.get_constants)
+        self._callable_index = LazyNameIndex(self._get_callable_object, self.get_callable_objects)
 
     def load_module(self, module):
         """
@@ -29,53 +256,325 @@ class ModuleLoader:
                 self._callable_objects.append(self._callable_constructor(key, value))
             else:
                 self._constants.append(self._constant_constructor(key, value))
+        self._loaded = True
+
+    def _load(self):
+        """
+        Loads module on first call.
+        """
+        if not self._loaded:
+            self.load_module(self._module_name)
+
+    def _get_names(self):
+        """
+        Returns ModuleNames from snapshot. Introspects module and saves its
+        names to snapshot if there is no actual one.
+        """
+        if self._names is None:
+            self._names = self._snapshot.load(self._module_name)
+            if self._names is None:
+                self._load()
+                self._names = ModuleNames(
+                    frozenset(cst.pattern for cst in self._constants),
+                    frozenset(clb.pattern for clb in self._callable_objects),
+                )
+                self._snapshot.save(self._module_name, self._names)
+        return self._names
+
+    def _get_value(self, name):
+        """
+        Imports module if needed. Returns value of name from module namespace
+        or _MISSING.
+        """
+        if self._module is None:
+            self._module = __import__(self._module_name)
+        return self._module.__dict__.get(name, _MISSING)
+
+    def _get_constant(self, name):
+        """
+        Returns constant with name or None.
+        """
+        if self._snapshot is not None and name not in self._get_names().constants:
+            return None
+        value = self._get_value(name)
+        if value is _MISSING or callable(value):
+            return None
+        return self._constant_constructor(name, value)
+
+    def _get_callable_object(self, name):
+        """
+        Returns callable object with name or None.
+        """
+        if self._snapshot is not None and name not in self._get_names().callable_objects:
+            return None
+        value = self._get_value(name)
+        if value is _MISSING or not callable(value):
+            return None
+        return self._callable_constructor(name, value)
+
+    @property
+    def constant_index(self):
+        """
+        LazyNameIndex of constants.
+        """
+        return self._constant_index
+
+    @property
+    def callable_index(self):
+        """
+        LazyNameIndex of callable objects.
+        """
+        return self._callable_index
 
     def get_constants(self):
         """
         Returns list of constants.
         """
+        self._load()
         return list(self._constants)
 
     def get_callable_objects(self):
         """
         Returns list of callable objects.
         """
+        self._load()
         return list(self._callable_objects)
 
 
 class ModulesScope:
     """
     Provides access to constants and callable objects of corresponding modules.
+    Names are resolved lazily: modules are imported on first reference to a
+    name, lists of all names are generated on first request.
+
+    If memoize is positive, pure callable objects (see is_pure) are wrapped
+    with MemoizedCallable which caches up to memoize results per function,
+    shared by all expressions of scope.
     """
-    def __init__(self, *modules, module_loader=ModuleLoader):
+    def __init__(self, *modules, module_loader=ModuleLoader, memoize=0):
+        self._fingerprint = (module_loader, modules, memoize)
         self._modules = [module_loader(m) for m in modules]
+        self._memoize = memoize
+        self._memoized = {}
+        self._memoized_lock = None
+        if memoize:
+            import threading
+
+            self._memoized_lock = threading.Lock()
         self._constants = []
         self._callable_objects = []
-        self.gen_scope()
+        self._loaded = False
+        self._constant_index = LazyNameIndex(self._get_constant, self.get_constants)
+        self._callable_index = LazyNameIndex(self._get_callable_object, self.get_callable_objects)
 
     def gen_scope(self):
         """
         Loads all constants and callable objects from all modules.
         """
+        constants = set()
+        callable_objects = set()
         for module in reversed(self._modules):
             for cst in module.get_constants():
-                if cst not in self._constants:
+                if self._add_unique(cst, constants):
                     self._constants.append(cst)
             for clb in module.get_callable_objects():
-                if clb not in self._callable_objects:
-                    self._callable_objects.append(clb)
+                if self._add_unique(clb, callable_objects):
+                    self._callable_objects.append(self._memoize_callable(clb))
+        self._constants.sort(key=lambda x: len(x.pattern), reverse=True)
+        self._callable_objects.sort(key=lambda x: len(x.pattern), reverse=True)
+        self._loaded = True
+
+    @staticmethod
+    def _add_unique(obj, seen):
+        """
+        Adds obj to seen set. Returns False if equal object was already seen.
+        Objects with unhashable values are compared by identity of value.
+        """
+        key = obj
+        try:
+            hash(key)
+        except TypeError:
+            key = (obj.pattern, id(obj[1]))
+        if key in seen:
+            return False
+        seen.add(key)
+        return True
+
+    def _load(self):
+        """
+        Generates scope on first call.
+        """
+        if not self._loaded:
+            self.gen_scope()
+
+    def _get_constant(self, name):
+        """
+        Returns constant with name from the last module which has it or None.
+        """
+        for module in reversed(self._modules):
+            cst = module.constant_index.get(name)
+            if cst is not None:
+                return cst
+        return None
+
+    def _get_callable_object(self, name):
+        """
+        Returns callable object with name from the last module which has it
+        or None.
+        """
+        for module in reversed(self._modules):
+            clb = module.callable_index.get(name)
+            if clb is not None:
+                return self._memoize_callable(clb)
+        return None
+
+    def _memoize_callable(self, clb):
+        """
+        Returns callable object with memoized function if memoization is
+        enabled and function is pure, else clb itself. Every function is
+        wrapped once.
+        """
+        if not self._memoize or not is_pure(clb.execute):
+            return clb
+        with self._memoized_lock:
+            memoized = self._memoized.get(clb.execute)
+            if memoized is None:
+                memoized = MemoizedCallable(clb.execute, self._memoize)
+                self._memoized[clb.execute] = memoized
+        return clb._replace(execute=memoized)
+
+    def memo_info(self):
+        """
+        Returns dict of MemoInfo of memoized functions by their qualified
+        names.
+        """
+        if self._memoized_lock is None:
+            return {}
+        with self._memoized_lock:
+            memoized = list(self._memoized.values())
+        return {func.__name__: func.info() for func in memoized}
+
+    @property
+    def fingerprint(self):
+        """
+        Hashable identity of scope contents: module loader and module names.
+        """
+        return self._fingerprint
+
+    @property
+    def constant_index(self):
+        """
+        LazyNameIndex of constants.
+        """
+        return self._constant_index
+
+    @property
+    def callable_index(self):
+        """
+        LazyNameIndex of callable objects.
+        """
+        return self._callable_index
 
     def get_constants(self):
         """
         Returns sorted by name length (longest first) list of constants.
         """
-        return sorted(self._constants, key=lambda x: len(x.pattern), reverse=True)
+        self._load()
+        return list(self._constants)
 
     def get_callable_objects(self):
         """
         Returns sorted by name length (longest first) list of callable objects.
         """
-        return sorted(self._callable_objects, key=lambda x: len(x.pattern), reverse=True)
+        self._load()
+        return list(self._callable_objects)
+
+    def freeze(self):
+        """
+        Returns FrozenScope with all constants and callable objects of scope.
+        """
+        return FrozenScope(self.get_constants(), self.get_callable_objects(), self._fingerprint)
+
+
+class FrozenScope:
+    """
+    Immutable scope: all names are loaded and indexed on creation, so
+    lookups never import modules or fill caches, and one FrozenScope may be
+    used by any number of threads without locks.
+    """
+    __slots__ = ('_constants', '_callable_objects', '_constant_index', '_callable_index',
+                 '_fingerprint')
+
+    def __init__(self, constants, callable_objects, fingerprint=None):
+        """
+        Positional arguments:
+            constants: iterable of constants, the first of equal patterns
+                is used
+            callable_objects: iterable of callable objects, the first of
+                equal patterns is used
+
+        Optional keyword arguments:
+            fingerprint: hashable identity of scope contents, by default
+                patterns and identities of values
+        """
+        constants = tuple(constants)
+        callable_objects = tuple(callable_objects)
+        if fingerprint is None:
+            fingerprint = (
+                tuple((cst.pattern, id(cst.value)) for cst in constants),
+                tuple((clb.pattern, id(clb.execute)) for clb in callable_objects),
+            )
+        setattr_ = super().__setattr__
+        setattr_('_constants', constants)
+        setattr_('_callable_objects', callable_objects)
+        setattr_('_constant_index', NameIndex(constants))
+        setattr_('_callable_index', NameIndex(callable_objects))
+        setattr_('_fingerprint', (FrozenScope, fingerprint))
+
+    def __setattr__(self, name, value):
+        """
+        Raises AttributeError: FrozenScope is immutable.
+        """
+        raise AttributeError('FrozenScope is immutable')
+
+    def __delattr__(self, name):
+        """
+        Raises AttributeError: FrozenScope is immutable.
+        """
+        raise AttributeError('FrozenScope is immutable')
+
+    @property
+    def fingerprint(self):
+        """
+        Hashable identity of scope contents.
+        """
+        return self._fingerprint
+
+    @property
+    def constant_index(self):
+        """
+        NameIndex of constants.
+        """
+        return self._constant_index
+
+    @property
+    def callable_index(self):
+        """
+        NameIndex of callable objects.
+        """
+        return self._callable_index
+
+    def get_constants(self):
+        """
+        Returns list of constants.
+        """
+        return list(self._constants)
+
+    def get_callable_objects(self):
+        """
+        Returns list of callable objects.
+        """
+        return list(self._callable_objects)
 
 
 BUILT_INS = ModuleLoader('builtins')
@@ -0,0 +1,215 @@
+"""
+This module provides optimization passes over expression trees.
+"""
+import math
+from operator import add, sub, mul, truediv, floordiv, mod, neg, lt, le, eq, ne, ge, gt
+
+from pycalc.exprtree import Literal, Name, Variable, Unary, Binary, Call, postorder, evaluate
+from pycalc.memoize import unwrap
+from pycalc.moduleloader import Callable, is_pure, register_pure
+
+INT_CALLABLES = frozenset((
+    int, len, math.floor, math.ceil, math.trunc, math.factorial, math.gcd, math.isqrt,
+))
+FLOAT_CALLABLES = frozenset((
+    float, math.sin, math.cos, math.tan, math.asin, math.acos, math.atan, math.atan2,
+    math.sinh, math.cosh, math.tanh, math.asinh, math.acosh, math.atanh, math.exp,
+    math.expm1, math.log, math.log10, math.log2, math.log1p, math.sqrt, math.fabs,
+    math.degrees, math.radians, math.hypot, math.copysign, math.fmod, math.pow,
+))
+ARITHMETIC_OPERATORS = frozenset((add, sub, mul, floordiv, mod))
+COMPARISON_OPERATORS = frozenset((lt, le, eq, ne, ge, gt))
+
+
+@register_pure
+def power_mod(base, exponent, modulus):
+    """
+    Returns base ^ exponent % modulus. Uses three-argument pow, which does
+    not create base ^ exponent, when result is the same: for integer
+    arguments, non-negative exponent and non-zero modulus.
+    """
+    if (type(base) is int and type(exponent) is int and type(modulus) is int
+            and exponent >= 0 and modulus):
+        return pow(base, exponent, modulus)
+    return pow(base, exponent) % modulus
+
+
+POWER_MOD = Callable('pow', power_mod)
+
+
+def is_constant(node):
+    """
+    Returns True if node is literal or constant.
+    """
+    node_type = type(node)
+    return node_type is Literal or node_type is Name
+
+
+def fold(node, limits=None):
+    """
+    Returns Literal with result of node whose children are constants, or
+    node itself if evaluation fails or exceeds limits: the error is raised
+    when expression is evaluated, as without folding.
+    """
+    try:
+        return Literal(evaluate(limits.guard(node) if limits is not None else node))
+    except Exception:
+        return node
+
+
+def number_type(node, types):
+    """
+    Returns int or float if node is known to evaluate to number of this
+    type (bool is not int here), else None.
+
+    Positional arguments:
+        node: node of expression tree
+        types: dict of types of already visited nodes by their ids
+    """
+    node_type = type(node)
+    if node_type is Literal or node_type is Name:
+        value_type = type(node.value)
+        return value_type if value_type in (int, float) else None
+    if node_type is Unary:
+        operand = types.get(id(node.operand))
+        return operand if node.operator.unary is neg or is_identity(node.operator.unary) else None
+    if node_type is Binary:
+        func = node.operator.execute
+        left, right = types.get(id(node.left)), types.get(id(node.right))
+        if left is None or right is None:
+            return None
+        if func in ARITHMETIC_OPERATORS:
+            return int if left is int and right is int else float
+        if func is truediv:
+            return float
+        if func is pow and right is int:
+            if left is float:
+                return float
+            if is_natural(node.right):
+                return int
+        return None
+    if node_type is Call:
+        func = unwrap(node.callable.execute)
+        try:
+            if func in INT_CALLABLES:
+                return int
+            if func in FLOAT_CALLABLES:
+                return float
+        except TypeError:
+            return None
+    return None
+
+
+def is_identity(func):
+    """
+    Returns True if func is unary plus operator.
+    """
+    from pycalc.calcexpression import identity
+    return func is identity
+
+
+def is_natural(node):
+    """
+    Returns True if node is non-negative integer literal.
+    """
+    return is_constant(node) and type(node.value) is int and node.value >= 0
+
+
+def is_literal(node, value, value_type):
+    """
+    Returns True if node is literal value of exactly value_type.
+    """
+    return is_constant(node) and type(node.value) is value_type and node.value == value
+
+
+def rewrite(node, types):
+    """
+    Returns cheaper node equivalent to Binary node or node itself.
+    """
+    func = node.operator.execute
+    left, right = node.left, node.right
+    left_type, right_type = types.get(id(left)), types.get(id(right))
+    if func is mul:
+        if is_literal(right, 1, int) and left_type in (int, float):
+            return left
+        if is_literal(left, 1, int) and right_type in (int, float):
+            return right
+        if is_literal(right, 1.0, float) and left_type is float:
+            return left
+    elif func is add:
+        if is_literal(right, 0, int) and left_type is int:
+            return left
+        if is_literal(left, 0, int) and right_type is int:
+            return right
+    elif func is sub:
+        if is_literal(right, 0, int) and left_type in (int, float):
+            return left
+    elif func is pow:
+        if is_literal(right, 1, int) and left_type is int:
+            return left
+    elif func is mod and type(left) is Binary and left.operator.execute is pow:
+        from pycalc.calcexpression import Operator, comma_operator
+        comma = Operator(',', comma_operator, -1, None)
+        argument = Binary(comma, Binary(comma, left.left, left.right), right)
+        return Call(POWER_MOD, argument)
+    return node
+
+
+def optimize(tree, limits=None):
+    """
+    Returns optimized expression tree. Both optimizations are done in one
+    postorder pass, nodes whose children are not changed are not rebuilt.
+
+    Subtrees built only from literals, constants, pure operators and pure
+    callable objects are folded: replaced with literals of their results.
+    Subtrees with variables or impure callable objects, e.g. input or
+    print, are kept.
+
+    Expensive operations are replaced with cheaper ones where result is the
+    same for int and float values:
+        a ^ b % m is evaluated with three-argument pow for integers;
+        x * 1, 1 * x and x - 0 are x for int and float x;
+        x + 0, 0 + x and x ^ 1 are x for int x.
+    Types of variables are unknown, so only the first rule applies to them.
+    x ^ 0.5 is not replaced with sqrt(x) and x ^ 2 with x * x for floats:
+    pow may differ from them in the last bit. For ints x * x is not faster
+    than pow.
+
+    Positional arguments:
+        tree: root node of expression tree
+
+    Optional keyword arguments:
+        limits: EvaluationLimits checked while constant subtrees are folded
+    """
+    nodes = []
+    types = {}
+    for node in postorder(tree):
+        node_type = type(node)
+        if node_type is Unary:
+            operand = nodes.pop()
+            if operand is not node.operand:
+                node = Unary(node.operator, operand)
+            if is_constant(operand) and is_pure(node.operator.unary):
+                node = fold(node, limits)
+        elif node_type is Binary:
+            right = nodes.pop()
+            left = nodes.pop()
+            if left is not node.left or right is not node.right:
+                node = Binary(node.operator, left, right)
+            if is_constant(left) and is_constant(right) and is_pure(node.operator.execute):
+                node = fold(node, limits)
+            if type(node) is Binary:
+                node = rewrite(node, types)
+        elif node_type is Call:
+            if node.argument is None:
+                if is_pure(node.callable.execute):
+                    node = fold(node, limits)
+            else:
+                argument = nodes.pop()
+                if argument is not node.argument:
+                    node = Call(node.callable, argument)
+                if is_constant(argument) and is_pure(node.callable.execute):
+                    node = fold(node, limits)
+        types[id(node)] = number_type(node, types)
+        nodes.append(node)
+    return nodes[0]
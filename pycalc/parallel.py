@@ -0,0 +1,99 @@
+"""
+This module provides evaluation of many expressions in worker processes.
+"""
+import multiprocessing
+from collections import deque
+from functools import partial
+from itertools import islice
+
+from pycalc.batch import evaluate_lines, to_text
+from pycalc.moduleloader import ModuleLoader, ModulesScope
+from pycalc.parsecache import ExpressionCache
+from pycalc.scopesnapshot import ScopeSnapshot
+
+DEFAULT_MODULES = ('builtins', 'math')
+
+_worker_scope = None
+_worker_cache = None
+_worker_limits = None
+
+
+def init_worker(modules, limits=None):
+    """
+    Initializer of worker process: creates scope of modules and loads all
+    its names once, so chunks are evaluated without start-up cost.
+
+    Positional arguments:
+        modules: tuple of names of modules
+
+    Optional keyword arguments:
+        limits: EvaluationLimits of every expression
+    """
+    global _worker_scope, _worker_cache, _worker_limits
+    _worker_limits = limits
+    _worker_scope = ModulesScope(*modules, module_loader=partial(ModuleLoader, snapshot=ScopeSnapshot()))
+    _worker_scope.get_constants()
+    _worker_cache = ExpressionCache()
+
+
+def evaluate_chunk(chunk):
+    """
+    Returns list of BatchResults of chunk in worker process. Values are
+    converted to str in worker, so results are always picklable.
+
+    Positional arguments:
+        chunk: tuple of number of the first line and list of lines
+    """
+    start, lines = chunk
+    results = evaluate_lines(lines, scope=_worker_scope, cache=_worker_cache, start=start,
+                             limits=_worker_limits)
+    return [to_text(result) for result in results]
+
+
+def split_chunks(lines, chunksize):
+    """
+    Yields tuples of number of the first line and list of at most chunksize
+    lines.
+
+    Positional arguments:
+        lines: iterable of lines
+        chunksize: number of lines in chunk
+    """
+    lines = iter(lines)
+    start = 1
+    while True:
+        chunk = list(islice(lines, chunksize))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def evaluate_parallel(lines, modules=DEFAULT_MODULES, jobs=None, chunksize=1000, prefetch=2,
+                      limits=None):
+    """
+    Yields BatchResult with str value for every line in order of lines.
+    Chunks of lines
+    are evaluated by pool of worker processes. At most jobs * prefetch
+    chunks are read ahead, so memory does not depend on number of lines.
+
+    Positional arguments:
+        lines: iterable of lines with one expression per line
+
+    Optional keyword arguments:
+        modules: names of modules with callable objects and constants
+        jobs: number of worker processes, number of CPUs by default
+        chunksize: number of lines sent to worker at once
+        prefetch: number of chunks per worker evaluated ahead of consumer
+        limits: EvaluationLimits of every expression
+    """
+    jobs = jobs or multiprocessing.cpu_count()
+    chunks = split_chunks(lines, chunksize)
+    with multiprocessing.Pool(jobs, initializer=init_worker, initargs=(tuple(modules), limits)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(evaluate_chunk, (chunk,)))
+            if len(pending) >= jobs * prefetch:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
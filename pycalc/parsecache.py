@@ -0,0 +1,110 @@
+"""
+This module provides process-wide cache of compiled expressions.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+from pycalc.calcexpression import Expression
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses evictions size maxsize')
+
+
+class ExpressionCache:
+    """
+    Bounded LRU cache of compiled expressions keyed by expression text and
+    fingerprint of operators, callable objects and constants scope.
+    """
+
+    def __init__(self, maxsize=4096, metrics=None):
+        """
+        Optional keyword arguments:
+            maxsize: maximal number of cached expressions
+            metrics: MetricsRegistry passed to all created expressions
+        """
+        self._maxsize = maxsize
+        self._metrics = metrics
+        self._expressions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(expr):
+        """
+        Returns expression text used as a cache key. Only surrounding
+        whitespace is removed: spaces inside expression are validated by
+        Expression, so '1 2' and '12' must not share a key.
+        """
+        return expr.strip()
+
+    @staticmethod
+    def fingerprint(scope=None, operators=None, limits=None):
+        """
+        Returns hashable fingerprint of scope, operators and limits. Default
+        scope, default operators and no limits are fingerprinted as None.
+        """
+        scope_fingerprint = scope.fingerprint if scope is not None else None
+        operators_fingerprint = tuple(map(id, operators)) if operators is not None else None
+        limits_fingerprint = limits.fingerprint if limits is not None else None
+        return scope_fingerprint, operators_fingerprint, limits_fingerprint
+
+    def get(self, expr, scope=None, operators=None, limits=None):
+        """
+        Returns compiled Expression from cache or creates, compiles and caches
+        new one.
+
+        Positional arguments:
+            expr: expression string
+
+        Optional keyword arguments:
+            scope: ModulesScope with callable objects and constants
+            operators: list of operators
+            limits: EvaluationLimits
+        """
+        key = (self.normalize(expr), self.fingerprint(scope, operators, limits))
+        with self._lock:
+            expression = self._expressions.get(key)
+            if expression is not None:
+                self._expressions.move_to_end(key)
+                self.hits += 1
+                return expression
+            self.misses += 1
+
+        expression = Expression(expr, operators=operators, scope=scope, limits=limits,
+                                metrics=self._metrics)
+        expression.compile()
+
+        with self._lock:
+            self._expressions[key] = expression
+            self._expressions.move_to_end(key)
+            while len(self._expressions) > self._maxsize:
+                self._expressions.popitem(last=False)
+                self.evictions += 1
+        return expression
+
+    def info(self):
+        """
+        Returns CacheInfo with hits, misses, evictions counters and sizes.
+        """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions,
+                             len(self._expressions), self._maxsize)
+
+    def clear(self):
+        """
+        Removes all cached expressions and resets counters.
+        """
+        with self._lock:
+            self._expressions.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+EXPRESSION_CACHE = ExpressionCache()
+
+
+def get_expression(expr, scope=None, operators=None, limits=None):
+    """
+    Returns compiled Expression from process-wide EXPRESSION_CACHE.
+    """
+    return EXPRESSION_CACHE.get(expr, scope=scope, operators=operators, limits=limits)
@@ -0,0 +1,224 @@
+"""
+This module provides profiling of expression evaluation: call counts and
+cumulative and own time per operator, callable object and subexpression.
+
+Profiling is opt-in (see Expression.profile()): evaluate() and programs do
+not call the profiler at all.
+"""
+import time
+from collections import namedtuple
+
+from pycalc.exceptions import PyCalcSyntaxError
+from pycalc.exprtree import Literal, Name, Variable, Unary, Binary, Call, children
+
+ProfileEntry = namedtuple('ProfileEntry', 'name calls cumulative own')
+ProfileReport = namedtuple('ProfileReport', 'result phases operators callables subexpressions')
+
+SOURCE_LIMIT = 60
+
+
+def node_source(node, limit=SOURCE_LIMIT):
+    """
+    Returns expression text of subtree, shortened to limit characters.
+    Binary operands are enclosed in brackets, so the text does not depend
+    on weights of operators.
+
+    Positional arguments:
+        node: root node of expression tree
+
+    Optional keyword arguments:
+        limit: maximal length of text
+    """
+    parts = []
+    size = 0
+    stack = [node]
+    while stack and size <= limit:
+        item = stack.pop()
+        item_type = type(item)
+        if item_type is str:
+            text = item
+        elif item_type is Literal:
+            text = repr(item.value)
+        elif item_type is Name:
+            text = item.pattern
+        elif item_type is Variable:
+            text = item.name
+        elif item_type is Call:
+            text = item.callable.pattern
+            if item.argument is not None:
+                stack.extend((')', item.argument, '('))
+        elif item_type is Unary:
+            text = item.operator.pattern
+            stack.extend(_operand(item.operand, None))
+        else:
+            text = ''
+            stack.extend(_operand(item.right, item.operator))
+            stack.append(item.operator.pattern)
+            stack.extend(_operand(item.left, item.operator))
+        parts.append(text)
+        size += len(text)
+    text = ''.join(parts)
+    if stack or len(text) > limit:
+        return text[:limit] + '...'
+    return text
+
+
+def _operand(node, operator):
+    """
+    Returns reversed list of items of operand: node itself or node enclosed
+    in brackets if it is binary operator (except comma inside comma) or
+    unary operand of binary operator.
+    """
+    node_type = type(node)
+    if operator is None:
+        bracketed = node_type is Binary
+    else:
+        bracketed = (node_type is Unary or
+                     node_type is Binary and not node.operator.pattern == operator.pattern == ',')
+    if bracketed:
+        return [')', node, '(']
+    return [node]
+
+
+class Profiler:
+    """
+    Collects times of phases of expression processing and evaluates
+    expression tree measuring every node.
+    """
+
+    def __init__(self, timer=time.perf_counter):
+        """
+        Optional keyword arguments:
+            timer: function which returns current time in seconds
+        """
+        self._timer = timer
+        self._phases = {}
+        self._operators = {}
+        self._callables = {}
+        self._subexpressions = []
+
+    def phase(self, name, func, *args):
+        """
+        Calls func with args, adds its time to phase name. Returns result of
+        func.
+        """
+        start = self._timer()
+        try:
+            return func(*args)
+        finally:
+            self._phases[name] = self._phases.get(name, 0.0) + self._timer() - start
+
+    @staticmethod
+    def _add(stats, key, cumulative, own):
+        """
+        Adds call of key to stats dict of [calls, cumulative, own] lists.
+        """
+        entry = stats.get(key)
+        if entry is None:
+            stats[key] = [1, cumulative, own]
+        else:
+            entry[0] += 1
+            entry[1] += cumulative
+            entry[2] += own
+
+    def evaluate(self, tree, bindings=None):
+        """
+        Walks expression tree as exprtree.evaluate() does and records count,
+        cumulative time (with operands) and own time (without operands) of
+        every operator, callable object and subexpression. Returns result of
+        execution.
+
+        Positional arguments:
+            tree: root node of expression tree
+
+        Optional keyword arguments:
+            bindings: mapping of variable names to their values
+        """
+        timer = self._timer
+        values = []
+        times = []
+        stack = [(tree, None)]
+        while stack:
+            node, start = stack.pop()
+            node_children = children(node)
+            if start is None:
+                start = timer()
+                if node_children:
+                    stack.append((node, start))
+                    stack.extend((child, None) for child in reversed(node_children))
+                    continue
+            node_type = type(node)
+            if node_type is Literal or node_type is Name:
+                values.append(node.value)
+            elif node_type is Variable:
+                try:
+                    values.append(bindings[node.name])
+                except (KeyError, TypeError):
+                    raise PyCalcSyntaxError('unknown name "{}"'.format(node.name))
+            elif node_type is Binary:
+                right = values.pop()
+                values[-1] = node.operator.execute(values[-1], right)
+            elif node_type is Unary:
+                values[-1] = node.operator.unary(values[-1])
+            elif node.argument is None:
+                values.append(node.callable.execute())
+            elif isinstance(values[-1], tuple):
+                values[-1] = node.callable.execute(*values[-1])
+            else:
+                values[-1] = node.callable.execute(values[-1])
+            cumulative = timer() - start
+            own = cumulative
+            for _ in node_children:
+                own -= times.pop()
+            times.append(cumulative)
+            if node_type is Binary:
+                self._add(self._operators, node.operator.pattern, cumulative, own)
+            elif node_type is Unary:
+                self._add(self._operators, 'unary ' + node.operator.pattern, cumulative, own)
+            elif node_type is Call:
+                self._add(self._callables, node.callable.pattern, cumulative, own)
+            else:
+                continue
+            self._subexpressions.append((node, cumulative, own))
+        return values[0]
+
+    def report(self, result):
+        """
+        Returns ProfileReport with result, dict of times of phases and lists
+        of ProfileEntry of operators, callable objects and subexpressions
+        sorted by own time (subexpressions by cumulative time), slowest first.
+        Cumulative time of nested calls of the same operator or callable
+        object is counted at every level.
+        """
+        def entries(stats):
+            return sorted((ProfileEntry(name, *values) for name, values in stats.items()),
+                          key=lambda entry: entry.own, reverse=True)
+
+        subexpressions = sorted(
+            (ProfileEntry(node_source(node), 1, cumulative, own)
+             for node, cumulative, own in self._subexpressions),
+            key=lambda entry: entry.cumulative, reverse=True
+        )
+        return ProfileReport(result, dict(self._phases), entries(self._operators),
+                             entries(self._callables), subexpressions)
+
+
+def format_report(report, limit=10):
+    """
+    Returns text of ProfileReport: times of phases and tables of at most
+    limit slowest operators, callable objects and subexpressions.
+    """
+    lines = ['phase          time, ms']
+    lines += ['{:14} {:9.3f}'.format(name, value * 1000) for name, value in report.phases.items()]
+    tables = (('operator', report.operators), ('callable', report.callables),
+              ('subexpression', report.subexpressions))
+    for title, entries in tables:
+        if not entries:
+            continue
+        lines.append('')
+        lines.append('{:>9} {:>15} {:>12}  {}'.format('calls', 'cumulative, ms', 'own, ms', title))
+        for entry in entries[:limit]:
+            lines.append('{:9d} {:15.3f} {:12.3f}  {}'.format(
+                entry.calls, entry.cumulative * 1000, entry.own * 1000, entry.name
+            ))
+    return '\n'.join(lines)
@@ -0,0 +1,108 @@
+"""
+This module provides persistent on-disk snapshot of module names, so that
+modules are not introspected on every run.
+"""
+import os
+import sys
+from collections import namedtuple
+
+ModuleNames = namedtuple('ModuleNames', 'constants callable_objects')
+
+SNAPSHOT_VERSION = 1
+
+
+def default_directory():
+    """
+    Returns snapshot directory: $PYCALC_CACHE_DIR, or pycalc directory in
+    $XDG_CACHE_HOME or in ~/.cache.
+    """
+    directory = os.environ.get('PYCALC_CACHE_DIR')
+    if directory:
+        return directory
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'pycalc')
+
+
+def module_key(module):
+    """
+    Returns list which identifies module contents without importing it:
+    python version, module origin and modification time and size of module
+    file. Returns None if module can not be found.
+    """
+    version = [SNAPSHOT_VERSION, sys.implementation.cache_tag, sys.version]
+    if module in sys.builtin_module_names:
+        return version + [module, 'built-in']
+    from importlib.machinery import PathFinder
+
+    spec = PathFinder.find_spec(module)
+    if spec is None or not spec.origin:
+        return None
+    try:
+        stat = os.stat(spec.origin)
+    except OSError:
+        return None
+    return version + [module, spec.origin, stat.st_mtime_ns, stat.st_size]
+
+
+class ScopeSnapshot:
+    """
+    Stores names of constants and callable objects of modules in JSON files,
+    one file per module. Entry is used only while module key is unchanged.
+    """
+
+    def __init__(self, directory=None):
+        """
+        Optional keyword arguments:
+            directory: directory of snapshot files, default_directory() by
+                default
+        """
+        self._directory = directory or default_directory()
+
+    def _path(self, module):
+        """
+        Returns path of snapshot file of module.
+        """
+        return os.path.join(self._directory, '{}.json'.format(module))
+
+    def load(self, module):
+        """
+        Returns ModuleNames of module or None if there is no actual snapshot.
+        """
+        key = module_key(module)
+        if key is None:
+            return None
+        import json
+
+        try:
+            with open(self._path(module), encoding='utf-8') as snapshot_file:
+                data = json.load(snapshot_file)
+        except (OSError, ValueError):
+            return None
+        if data.get('key') != key:
+            return None
+        return ModuleNames(frozenset(data['constants']), frozenset(data['callable_objects']))
+
+    def save(self, module, names):
+        """
+        Saves ModuleNames of module. Failures are ignored: snapshot is cache
+        only.
+        """
+        key = module_key(module)
+        if key is None:
+            return
+        import json
+
+        data = {
+            'key': key,
+            'constants': sorted(names.constants),
+            'callable_objects': sorted(names.callable_objects),
+        }
+        path = self._path(module)
+        temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            with open(temporary_path, 'w', encoding='utf-8') as snapshot_file:
+                json.dump(data, snapshot_file)
+            os.replace(temporary_path, path)
+        except OSError:
+            pass
@@ -0,0 +1,168 @@
+"""
+This module provides vectorized execution of programs over NumPy arrays.
+
+NumPy is optional dependency: it is imported only when program is
+vectorized.
+"""
+import builtins
+import math
+import operator
+import sys
+
+from pycalc.bytecode import Program, BINARY, CALL, CALL_NO_ARGUMENTS
+from pycalc.memoize import unwrap
+
+_UFUNCS = {}
+
+
+def has_arrays(values):
+    """
+    Returns True if any of values is NumPy array. Does not import NumPy.
+    """
+    numpy = sys.modules.get('numpy')
+    if numpy is None:
+        return False
+    return any(isinstance(value, numpy.ndarray) for value in values)
+
+
+def get_ufuncs():
+    """
+    Returns dict of python functions (operators, builtins and math callable
+    objects) and their NumPy equivalents. Imports NumPy.
+    """
+    if not _UFUNCS:
+        import numpy
+
+        def exact(func, *args):
+            """
+            Calls python func element by element. Result array has integer
+            dtype while results fit it, object dtype with exact python
+            integers otherwise.
+            """
+            result = numpy.frompyfunc(func, len(args), 1)(*args)
+            if isinstance(result, numpy.ndarray):
+                return numpy.array(result.tolist())
+            return result
+
+        def may_overflow(base, exponent):
+            """
+            Returns True if integer power of integer arrays may exceed int64.
+            """
+            base = numpy.asarray(base)
+            exponent = numpy.asarray(exponent)
+            if (base.dtype.kind not in 'iu' or exponent.dtype.kind not in 'iu'
+                    or not base.size or not exponent.size):
+                return False
+            largest = int(numpy.abs(base).max())
+            return largest > 1 and largest.bit_length() * int(exponent.max()) > 62
+
+        def power(base, exponent, modulus=None):
+            """
+            numpy.power which falls back to float power for negative integer
+            exponents, as python pow does. Integer powers which may exceed
+            int64 and powers with modulus are computed exactly by python pow
+            element by element instead of wrapping around.
+            """
+            if modulus is not None:
+                return exact(pow, base, exponent, modulus)
+            if may_overflow(base, exponent):
+                return exact(pow, base, exponent)
+            try:
+                return numpy.power(base, exponent)
+            except ValueError:
+                return numpy.float_power(base, exponent)
+
+        def log(value, base=None):
+            """
+            math.log with optional base.
+            """
+            if base is None:
+                return numpy.log(value)
+            return numpy.log(value) / numpy.log(base)
+
+        def power_mod(base, exponent, modulus):
+            """
+            optimizer.power_mod over arrays.
+            """
+            return exact(scalar_power_mod, base, exponent, modulus)
+
+        from pycalc.optimizer import power_mod as scalar_power_mod
+
+        _UFUNCS.update({
+            scalar_power_mod: power_mod,
+            operator.add: numpy.add,
+            operator.sub: numpy.subtract,
+            operator.mul: numpy.multiply,
+            operator.truediv: numpy.true_divide,
+            operator.floordiv: numpy.floor_divide,
+            operator.mod: numpy.remainder,
+            operator.lt: numpy.less,
+            operator.le: numpy.less_equal,
+            operator.eq: numpy.equal,
+            operator.ne: numpy.not_equal,
+            operator.ge: numpy.greater_equal,
+            operator.gt: numpy.greater,
+            builtins.pow: power,
+            builtins.abs: numpy.absolute,
+            builtins.round: numpy.round,
+            math.log: log,
+        })
+        names = {
+            'sin': 'sin', 'cos': 'cos', 'tan': 'tan', 'asin': 'arcsin',
+            'acos': 'arccos', 'atan': 'arctan', 'atan2': 'arctan2',
+            'sinh': 'sinh', 'cosh': 'cosh', 'tanh': 'tanh', 'asinh': 'arcsinh',
+            'acosh': 'arccosh', 'atanh': 'arctanh', 'exp': 'exp', 'expm1': 'expm1',
+            'log10': 'log10', 'log2': 'log2', 'log1p': 'log1p', 'sqrt': 'sqrt',
+            'fabs': 'fabs', 'floor': 'floor', 'ceil': 'ceil', 'trunc': 'trunc',
+            'degrees': 'degrees', 'radians': 'radians', 'hypot': 'hypot',
+            'copysign': 'copysign', 'fmod': 'fmod', 'pow': 'float_power',
+            'isnan': 'isnan', 'isinf': 'isinf', 'isfinite': 'isfinite',
+            'gcd': 'gcd', 'lcm': 'lcm',
+        }
+        for name, ufunc_name in names.items():
+            if hasattr(math, name):
+                _UFUNCS[getattr(math, name)] = getattr(numpy, ufunc_name)
+    return _UFUNCS
+
+
+def elementwise(func):
+    """
+    Returns wrapper of func which calls it for every element of broadcasted
+    array arguments. Scalar arguments are passed to func as is.
+    """
+    def wrapper(*args):
+        """
+        Calls func element by element if any of args is array.
+        """
+        if not has_arrays(args):
+            return func(*args)
+        import numpy
+        arrays = numpy.broadcast_arrays(*args)
+        result = [func(*items) for items in zip(*(array.flat for array in arrays))]
+        return numpy.array(result).reshape(arrays[0].shape)
+    return wrapper
+
+
+def vectorize(program):
+    """
+    Returns copy of program where operators and callable objects are replaced
+    with their NumPy ufunc equivalents. Callable objects without vectorized
+    counterpart are executed element by element.
+
+    Positional arguments:
+        program: bytecode.Program
+    """
+    ufuncs = get_ufuncs()
+    pool = list(program.pool)
+    replaced = set()
+    for opcode, argument in zip(program.code, program.arguments):
+        if argument in replaced or opcode not in (BINARY, CALL, CALL_NO_ARGUMENTS):
+            continue
+        replaced.add(argument)
+        func = pool[argument]
+        try:
+            pool[argument] = ufuncs[unwrap(func)]
+        except (KeyError, TypeError):
+            if opcode != BINARY:
+                pool[argument] = elementwise(func)
+    return Program(program.code, program.arguments, tuple(pool), program.variables)
@@ -13,9 +13,12 @@ setup(
     author_email='ivan_melnik@epam.com',
     entry_points={
         'console_scripts': [
-            'pycalc = pycalc.__main__:main'
+            'pycalc = pycalc.client:main'
         ]
     },
+    extras_require={
+        'numpy': ['numpy'],
+    },
     license='MIT',
     packages=['pycalc'],
     zip_safe=False
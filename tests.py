@@ -1,12 +1,66 @@
+import asyncio
+import io
+import itertools
+import json
 import os
+import socket
+import sys
+import tempfile
+import threading
+import time
 import unittest
 from collections import namedtuple
-from math import pi, e, log, sin, log10, cos
+from math import pi, e, log, sin, log10, cos, factorial, comb
 
 from pycalc.calcexpression import Expression, OPERATORS, CALLABLE_OBJECTS, CONSTANTS
-from pycalc.exceptions import PyCalcSyntaxError
-from pycalc.moduleloader import ModulesScope
+from pycalc.exceptions import PyCalcSyntaxError, PyCalcLimitError
+from pycalc.exprtree import Literal, Call, Binary
+from pycalc.bytecode import Program, LOAD, BINARY, CALL
+from pycalc.lexer import Lexer, NUMBER, OPERATOR, CONSTANT, CALLABLE, BRACKET_LEFT, BRACKET_RIGHT
+from pycalc.moduleloader import Callable, ModuleLoader, ModulesScope, NameIndex, is_pure
+from pycalc.parsecache import ExpressionCache, CacheInfo
+from pycalc.dag import ExpressionDAG, Failure
+from pycalc.limits import EvaluationLimits
+from pycalc.memoize import MemoizedCallable, MemoInfo
+from pycalc.compiled import CompiledExpression, compile_expression
+from pycalc.metrics import MetricsRegistry, PARSE, EVALUATE, to_prometheus
+from pycalc.profiler import Profiler, ProfileEntry, node_source, format_report
+from pycalc.aioservice import AsyncEvaluator, handle_connection
+from pycalc.batch import evaluate_lines, run_batch
+from pycalc.client import forward
+from pycalc.daemon import EvaluationServer
+from pycalc.parallel import evaluate_parallel, split_chunks
+from pycalc.scopesnapshot import ScopeSnapshot, ModuleNames
 from pycalc.__main__ import main as pycalc_main
+from benchmarks.corpus import CORPUS
+from benchmarks.run import compare, run
+from benchmarks.scaling import GENERATORS, fit_exponent
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class CacheDirectoryMixin:
+    """
+    Points PYCALC_CACHE_DIR to temporary directory during every test, so
+    that scope snapshots are not written to the cache of the user.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.cache_directory = tempfile.TemporaryDirectory()
+        self.cache_env = os.environ.get('PYCALC_CACHE_DIR')
+        os.environ['PYCALC_CACHE_DIR'] = self.cache_directory.name
+
+    def tearDown(self):
+        if self.cache_env is None:
+            del os.environ['PYCALC_CACHE_DIR']
+        else:
+            os.environ['PYCALC_CACHE_DIR'] = self.cache_env
+        self.cache_directory.cleanup()
+        super().tearDown()
 
 
 class TestExpressionMethods(unittest.TestCase):
@@ -81,6 +135,57 @@ class TestExpressionMethods(unittest.TestCase):
         for arg, result in test_list:
             self.assertEqual(result, Expression(arg).execute())
 
+    def test_compile(self):
+        expression = Expression('2+2*2')
+        tree = expression.compile()
+        self.assertIs(tree, expression.compile())
+        self.assertEqual('+', tree.operator.pattern)
+        self.assertEqual(Literal(2), tree.left)
+        self.assertEqual('*', tree.right.operator.pattern)
+
+    def test_evaluate(self):
+        test_list = [
+            ('round(2*(- 5 +9^3), 2)', 1448),
+            ('-sin(2)^2', -0.826821810431806),
+            ('sin(pi/2)1116', 1116.0),
+            ('2^-3', 2 ** -3),
+        ]
+        for arg, result in test_list:
+            expression = Expression(arg, callable_objects=self.scope.get_callable_objects(),
+                                    constants=self.scope.get_constants())
+            self.assertEqual(result, expression.evaluate(), msg=arg)
+            self.assertEqual(result, expression.evaluate(), msg=arg)
+
+    def test_variables(self):
+        expression = Expression('x*sin(y)+x', callable_objects=self.scope.get_callable_objects(),
+                                constants=self.scope.get_constants())
+        self.assertEqual(('x', 'y'), expression.variables)
+        self.assertEqual(2 * sin(pi / 2) + 2, expression.evaluate({'x': 2, 'y': pi / 2}))
+        self.assertEqual(3 * sin(0) + 3, expression.evaluate({'x': 3, 'y': 0}))
+        with self.assertRaises(PyCalcSyntaxError):
+            expression.evaluate({'x': 1})
+        with self.assertRaises(PyCalcSyntaxError):
+            Expression('x(2)').compile()
+
+    def test_evaluate_many(self):
+        expression = Expression('a^2-b', callable_objects=self.scope.get_callable_objects(),
+                                constants=self.scope.get_constants())
+        rows = [{'a': 2, 'b': 1}, (3, 4), [0, 1]]
+        self.assertEqual([3, 5, -1], list(expression.evaluate_many(rows)))
+        self.assertEqual([4.0], list(Expression('t+1').evaluate_many([{'t': 3.0}])))
+        self.assertEqual([2, 2], list(Expression('1+1').evaluate_many([{}, ()])))
+
+    def test_execute_large_expressions(self):
+        test_list = [
+            ('+'.join(['1'] * 20000), 20000),
+            ('(' * 5000 + '2' + ')' * 5000, 2),
+            ('-' * 5001 + '1', -1),
+            ('^'.join(['1'] * 5000), 1),
+            ('abs(' * 3000 + '-1' + ')' * 3000, 1),
+        ]
+        for arg, result in test_list:
+            self.assertEqual(result, Expression(arg).execute())
+
     def test_execute_binary_operator(self):
         test_list = [
             (('2+2', '2+2', None), (True, 4)),
@@ -259,7 +364,853 @@ class TestExpressionMethods(unittest.TestCase):
                 Expression(arg, callable_objects=CALLABLE_OBJECTS, constants=CONSTANTS, operators=OPERATORS).execute()
 
 
-class TestE2E(unittest.TestCase):
+class TestNameIndex(unittest.TestCase):
+
+    def setUp(self):
+        TestObject = namedtuple('TestObject', 'pattern value')
+        self.objects = [TestObject('log', 1), TestObject('log10', 2), TestObject('log', 3), TestObject('l', 4)]
+        self.index = NameIndex(self.objects)
+
+    def test_get(self):
+        self.assertIs(self.objects[0], self.index.get('log'))
+        self.assertIs(self.objects[1], self.index.get('log10'))
+        self.assertIsNone(self.index.get('lo'))
+        self.assertIn('l', self.index)
+        self.assertEqual(3, len(self.index))
+
+    def test_matches(self):
+        self.assertEqual([4, 1, 2], [obj.value for obj in self.index.matches('2+log100', 2)])
+        self.assertIs(self.objects[1], self.index.longest_match('log100'))
+        self.assertIs(self.objects[0], self.index.longest_match('log1'))
+        self.assertIsNone(self.index.longest_match('sin'))
+
+    def test_scope_indexes(self):
+        scope = ModulesScope('builtins', 'math')
+        self.assertIs(scope.get_callable_objects()[0], scope.callable_index.longest_match(
+            scope.get_callable_objects()[0].pattern))
+        self.assertEqual(pi, scope.constant_index.get('pi').value)
+        self.assertEqual(1.0, Expression('sin(pi/2)', scope=scope).execute())
+
+
+class TestLazyLoading(unittest.TestCase):
+
+    def test_names_are_resolved_without_introspection(self):
+        loaded = []
+
+        class Loader(ModuleLoader):
+            def load_module(self, module):
+                loaded.append(module)
+                super().load_module(module)
+
+        scope = ModulesScope('builtins', 'math', module_loader=Loader)
+        self.assertEqual(1.0, Expression('sin(pi/2)', scope=scope).execute())
+        self.assertEqual([], loaded)
+        self.assertEqual(pi, scope.constant_index.get('pi').value)
+        scope.get_constants()
+        self.assertEqual(['math', 'builtins'], loaded)
+
+    @unittest.skipIf('colorsys' in sys.modules, 'colorsys is already imported')
+    def test_modules_are_imported_on_first_reference(self):
+        scope = ModulesScope('colorsys', 'builtins', 'math')
+        self.assertEqual(1, Expression('abs(-1)', scope=scope).execute())
+        self.assertNotIn('colorsys', sys.modules)
+        self.assertEqual(1.0, Expression('max(hls_to_rgb(0, 1, 0))', scope=scope).execute())
+        self.assertIn('colorsys', sys.modules)
+
+
+class TestScopeSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshot = ScopeSnapshot(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_save_load(self):
+        names = ModuleNames(frozenset({'pi', 'e'}), frozenset({'sin'}))
+        self.assertIsNone(self.snapshot.load('math'))
+        self.snapshot.save('math', names)
+        self.assertEqual(names, self.snapshot.load('math'))
+        self.assertIsNone(ScopeSnapshot(os.path.join(self.directory.name, 'other')).load('math'))
+
+    def test_stale_snapshot(self):
+        self.snapshot.save('math', ModuleNames(frozenset(), frozenset()))
+        path = os.path.join(self.directory.name, 'math.json')
+        with open(path) as snapshot_file:
+            data = snapshot_file.read()
+        with open(path, 'w') as snapshot_file:
+            snapshot_file.write(data.replace('"math"', '"other"', 1))
+        self.assertIsNone(self.snapshot.load('math'))
+        with open(path, 'w') as snapshot_file:
+            snapshot_file.write('{')
+        self.assertIsNone(self.snapshot.load('math'))
+
+    def test_loader_creates_snapshot(self):
+        loader = ModuleLoader('math', snapshot=self.snapshot)
+        self.assertEqual(pi, loader.constant_index.get('pi').value)
+        names = self.snapshot.load('math')
+        self.assertIn('pi', names.constants)
+        self.assertIn('sin', names.callable_objects)
+        self.assertNotIn('sin', names.constants)
+
+    @unittest.skipIf('quopri' in sys.modules, 'quopri is already imported')
+    def test_unknown_names_are_resolved_without_import(self):
+        self.snapshot.save('quopri', ModuleNames(frozenset(), frozenset({'encodestring'})))
+        scope = ModulesScope('quopri', 'builtins', module_loader=lambda module: ModuleLoader(
+            module, snapshot=self.snapshot
+        ))
+        self.assertEqual(1, Expression('abs(-1)', scope=scope).execute())
+        self.assertNotIn('quopri', sys.modules)
+        self.assertIsNotNone(scope.callable_index.get('encodestring'))
+        self.assertIn('quopri', sys.modules)
+
+    def test_gen_scope(self):
+        scope = ModulesScope('builtins', 'math', 'builtins')
+        constants = scope.get_constants()
+        callable_objects = scope.get_callable_objects()
+        self.assertEqual(len(constants), len(set(map(id, constants))))
+        self.assertEqual(1, [clb.pattern for clb in callable_objects].count('abs'))
+        self.assertEqual(2, [clb.pattern for clb in callable_objects].count('pow'))
+        self.assertEqual(len(ModulesScope('builtins', 'math').get_callable_objects()), len(callable_objects))
+
+
+class TestLexer(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = ModulesScope('builtins', 'math')
+        self.lexer = Lexer(OPERATORS, self.scope.get_callable_objects(), self.scope.get_constants())
+
+    def kinds(self, expr):
+        return [token.kind for token in self.lexer.tokenize(expr)]
+
+    def test_tokenize(self):
+        test_list = [
+            ('1.5', [NUMBER]),
+            ('2>=-pi', [NUMBER, OPERATOR, OPERATOR, CONSTANT]),
+            ('log10(100)', [CALLABLE, BRACKET_LEFT, NUMBER, BRACKET_RIGHT]),
+            ('abs', [CALLABLE]),
+        ]
+        for arg, result in test_list:
+            self.assertEqual(result, self.kinds(arg), msg=arg)
+
+    def test_tokenize_values(self):
+        tokens = self.lexer.tokenize('10//.5')
+        self.assertEqual(10, tokens[0].value)
+        self.assertEqual('//', tokens[1].value.pattern)
+        self.assertEqual(0.5, tokens[2].value)
+        self.assertEqual(4, tokens[2].position)
+
+    def test_signed_exponent(self):
+        test_list = [
+            ('1e-3', 0.001),
+            ('1e+3', 1000.0),
+            ('2.5E-2', 0.025),
+            ('.5e+1', 5.0),
+        ]
+        for arg, result in test_list:
+            tokens = self.lexer.tokenize(arg)
+            self.assertEqual([NUMBER], [token.kind for token in tokens], msg=arg)
+            self.assertEqual(result, tokens[0].value, msg=arg)
+        self.assertEqual(1e-3 + 1, Expression('1e-3+1').execute())
+        self.assertEqual(1e+3 - 2, Expression('1e+3-2').execute())
+
+    def test_shortened_multiplication(self):
+        test_list = [
+            ('2(3)', [NUMBER, OPERATOR, BRACKET_LEFT, NUMBER, BRACKET_RIGHT]),
+            ('(3)2', [BRACKET_LEFT, NUMBER, BRACKET_RIGHT, OPERATOR, NUMBER]),
+        ]
+        for arg, result in test_list:
+            self.assertEqual(result, self.kinds(arg), msg=arg)
+        self.assertEqual('*', self.lexer.tokenize('2(3)')[1].value.pattern)
+
+    def test_error_cases(self):
+        for arg in ('log100(100)', 'pi(2)', '2$3', '.'):
+            with self.assertRaises(PyCalcSyntaxError, msg=arg):
+                self.lexer.tokenize(arg)
+
+
+class TestBytecode(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = ModulesScope('builtins', 'math')
+
+    def test_to_program(self):
+        program = Expression('2+2*2', optimize=False).to_program()
+        self.assertIsInstance(program, Program)
+        self.assertEqual(bytes([LOAD, LOAD, LOAD, BINARY, BINARY]), program.code)
+        self.assertEqual(1, program.pool.count(2))
+        self.assertEqual([0, 0, 0, 1, 2], list(program.arguments))
+
+    def test_execute(self):
+        test_list = [
+            ('round(2*(- 5 +9^3), 2)', 1448),
+            ('-sin(2)^2', -0.826821810431806),
+            ('2^2^3', 2 ** 2 ** 3),
+            ('102%12%7', 102 % 12 % 7),
+            ('log(e)', 1.0),
+        ]
+        for arg, result in test_list:
+            program = Expression(arg, callable_objects=self.scope.get_callable_objects(),
+                                 constants=self.scope.get_constants()).to_program()
+            self.assertEqual(result, program.execute(), msg=arg)
+            self.assertEqual(result, program.execute(), msg=arg)
+
+    def test_call_unpacks_tuple(self):
+        program = Expression('max(1,3,2)', optimize=False).to_program()
+        self.assertIn(CALL, program.code)
+        self.assertEqual(3, program.execute())
+
+
+class TestOptimizer(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = ModulesScope('builtins', 'math')
+
+    def test_is_pure(self):
+        for func in (sin, log, abs, round, max, pow, OPERATORS[0].execute):
+            self.assertTrue(is_pure(func), msg=func)
+        for func in (print, input, open, id, lambda x: x):
+            self.assertFalse(is_pure(func), msg=func)
+
+    def test_fold_huge_integers(self):
+        expression = Expression('2^20000+x')
+        self.assertEqual(2 ** 20000 + 1, expression.evaluate({'x': 1}))
+        self.assertEqual(2 ** 20000 + 1, expression.to_function()(1))
+        self.assertEqual(2 ** 20000, Expression('2^20000').execute())
+
+    def test_fold_constants(self):
+        test_list = [
+            ('2*pi/360', 2 * pi / 360),
+            ('sqrt(2)', 2 ** 0.5),
+            ('e^2', e ** 2),
+            ('max(1,3,2)', 3),
+            ('-+-2', 2),
+        ]
+        for arg, result in test_list:
+            tree = Expression(arg, scope=self.scope).optimize()
+            self.assertEqual(Literal(result), tree, msg=arg)
+
+    def test_keep_variables_and_impure_calls(self):
+        tree = Expression('x*(2*pi)', scope=self.scope).optimize()
+        self.assertIsInstance(tree, Binary)
+        self.assertEqual(Literal(2 * pi), tree.right)
+        tree = Expression('id(2+2)', scope=self.scope).optimize()
+        self.assertIsInstance(tree, Call)
+        self.assertEqual(Literal(4), tree.argument)
+
+    def test_keep_unchanged_subtrees(self):
+        expression = Expression('x*y+sin(z)-(2+3)', scope=self.scope)
+        tree = expression.compile()
+        optimized = expression.optimize()
+        self.assertIs(tree.left, optimized.left)
+        self.assertIs(tree.right.left, optimized.right.left)
+        self.assertEqual(Literal(5), optimized.right.right)
+        self.assertEqual(('x', 'y', 'z'), expression.variables)
+
+    def test_reduce_strength(self):
+        test_list = [
+            ('x^y%z', {'x': 3, 'y': 10 ** 6, 'z': 10 ** 9 + 7}, pow(3, 10 ** 6, 10 ** 9 + 7)),
+            ('x^y%z', {'x': 2.5, 'y': 2, 'z': 4}, 2.5 ** 2 % 4),
+            ('x^y%z', {'x': 2, 'y': -1, 'z': 3}, 2 ** -1 % 3),
+            ('floor(x)*1', {'x': 2.5}, 2),
+            ('floor(x)^1', {'x': 2.5}, 2),
+            ('x*1', {'x': True}, 1),
+            ('sin(x)+0', {'x': -0.0}, 0.0),
+        ]
+        for arg, bindings, result in test_list:
+            expression = Expression(arg, scope=self.scope)
+            self.assertEqual(repr(result), repr(expression.evaluate(bindings)), msg=arg)
+            self.assertEqual(repr(result), repr(expression.to_function()(*bindings.values())), msg=arg)
+        self.assertEqual('pow', Expression('x^y%z').optimize().callable.pattern)
+        self.assertIsInstance(Expression('floor(x)*1', scope=self.scope).optimize(), Call)
+        self.assertIsInstance(Expression('floor(x)^1', scope=self.scope).optimize(), Call)
+        self.assertIsInstance(Expression('x*1', scope=self.scope).optimize(), Binary)
+        self.assertIsInstance(Expression('sin(x)+0', scope=self.scope).optimize(), Binary)
+        with self.assertRaises(ZeroDivisionError):
+            Expression('x^y%z').evaluate({'x': 2, 'y': 3, 'z': 0})
+
+    def test_keep_errors(self):
+        expression = Expression('x+1/0', scope=self.scope)
+        self.assertIsInstance(expression.optimize().right, Binary)
+        with self.assertRaises(ZeroDivisionError):
+            expression.evaluate({'x': 1})
+
+
+class TestMemoize(unittest.TestCase):
+
+    def test_memoized_callable(self):
+        calls = []
+
+        def func(*args):
+            calls.append(args)
+            return args
+
+        memoized = MemoizedCallable(func, maxsize=2)
+        self.assertEqual((1,), memoized(1))
+        self.assertEqual((1,), memoized(1))
+        self.assertEqual((1.0,), memoized(1.0))
+        self.assertEqual((-0.0,), memoized(-0.0))
+        self.assertEqual(([],), memoized([]))
+        self.assertEqual(MemoInfo(1, 3, 2, 2), memoized.info())
+        memoized(1)
+        self.assertEqual([(1,), (1.0,), (-0.0,), ([],), (1,)], calls)
+
+    def test_memoized_scope(self):
+        scope = ModulesScope('builtins', 'math', memoize=16)
+        expression = Expression('factorial(x)+comb(x,2)+id(1)', scope=scope)
+        for _ in range(3):
+            self.assertEqual(factorial(10) + comb(10, 2) + id(1), expression.evaluate({'x': 10}))
+        info = scope.memo_info()
+        self.assertEqual(MemoInfo(2, 1, 1, 16), info['math.factorial'])
+        self.assertEqual(MemoInfo(2, 1, 1, 16), info['math.comb'])
+        self.assertNotIn('builtins.id', info)
+        with self.assertRaises(TypeError):
+            Expression('comb(x,2)', scope=scope).evaluate({'x': 10.0})
+        self.assertEqual(Literal(24), Expression('factorial(4)', scope=scope).optimize())
+        self.assertEqual({}, ModulesScope('math').memo_info())
+
+
+class TestExpressionDAG(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = ModulesScope('builtins', 'math')
+
+    def test_shared_subexpressions(self):
+        dag = ExpressionDAG()
+        normalization = 'sqrt(x^2+y^2)'
+        rules = ['x/{}'.format(normalization), 'y/{}'.format(normalization), '{}*2'.format(normalization)]
+        for rule in rules:
+            dag.add(Expression(rule, scope=self.scope))
+        separate = sum(len(Expression(rule, scope=self.scope).to_program()) for rule in rules)
+        self.assertLess(len(dag), separate / 2)
+        self.assertEqual(('x', 'y'), dag.variables)
+        self.assertEqual([0.6, 0.8, 10.0], dag.evaluate({'x': 3, 'y': 4}))
+        self.assertEqual([0.8, 0.6, 10.0], dag.evaluate({'x': 4, 'y': 3}))
+
+    def test_literal_types(self):
+        dag = ExpressionDAG()
+        first, second = dag.add(Expression('x+1')), dag.add(Expression('x+1.0'))
+        self.assertNotEqual(first, second)
+        self.assertEqual(first, dag.add(Expression('x+1')))
+        self.assertEqual([3, 3.0, 3], dag.evaluate({'x': 2}))
+        self.assertEqual('[3, 3.0, 3]', repr(dag.evaluate({'x': 2})))
+
+    def test_impure_calls_are_not_shared(self):
+        dag = ExpressionDAG()
+        impure = [dag.add(Expression('id(x)+1', scope=self.scope)) for _ in range(2)]
+        pure = [dag.add(Expression('abs(x)+1', scope=self.scope)) for _ in range(2)]
+        self.assertNotEqual(impure[0], impure[1])
+        self.assertEqual(pure[0], pure[1])
+        self.assertEqual(8, len(dag))
+
+    def test_errors(self):
+        dag = ExpressionDAG()
+        dag.add(Expression('x/y'))
+        dag.add(Expression('x+1'))
+        dag.add(Expression('z'))
+        results = dag.evaluate_all({'x': 1, 'y': 0})
+        self.assertIsInstance(results[0], Failure)
+        self.assertIsInstance(results[0].error, ZeroDivisionError)
+        self.assertEqual(2, results[1])
+        self.assertIsInstance(results[2].error, PyCalcSyntaxError)
+        with self.assertRaises(ZeroDivisionError):
+            dag.evaluate({'x': 1, 'y': 0, 'z': 1})
+
+
+class TestLimits(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = ModulesScope('builtins', 'math')
+        self.limits = EvaluationLimits(max_nodes=100, max_int_bits=10000, max_exponent=1000, timeout=1)
+
+    def test_limits(self):
+        test_list = [
+            ('9^9^9^9', 'exponent exceeds 1000'),
+            ('(2^100)^200', 'integer result exceeds 10000 bits'),
+            ('x^(9^9)', 'exponent exceeds 1000'),
+            ('(2^100)^60*(2^100)^60', 'integer result exceeds 10000 bits'),
+            ('factorial(10^4)', 'integer result exceeds 10000 bits'),
+            ('comb(10^5, 5000)', 'integer result exceeds 10000 bits'),
+            ('+'.join(['1'] * 101), 'expression has more than 100 nodes'),
+            ('__name__*10^6', 'sequence result exceeds 10000 items'),
+            ('len(__doc__*9^5)', 'sequence result exceeds 10000 items'),
+            ('prod(range(1, 3000))', 'integer result exceeds 10000 bits'),
+            ('3^(10^7)%(1==1)', 'exponent exceeds 1000'),
+            ('x^(10^7)%(x==x)', 'exponent exceeds 1000'),
+        ]
+        for arg, message in test_list:
+            with self.assertRaises(PyCalcLimitError, msg=arg) as context:
+                Expression(arg, scope=self.scope, limits=self.limits).evaluate({'x': 2})
+            self.assertEqual(message, context.exception.message, msg=arg)
+
+    def test_allowed(self):
+        test_list = [
+            ('2^1000', 2 ** 1000),
+            ('x^y%z', pow(3, 10 ** 9, 10 ** 9 + 7)),
+            ('1^(10^100)', 1),
+            ('2.0^5000', None),
+            ('factorial(100)', factorial(100)),
+            ('len(__name__*1000)', 4000),
+        ]
+        for arg, result in test_list:
+            expression = Expression(arg, scope=self.scope, limits=self.limits)
+            bindings = {'x': 3, 'y': 10 ** 9, 'z': 10 ** 9 + 7}
+            if result is None:
+                with self.assertRaises(OverflowError):
+                    expression.evaluate(bindings)
+            else:
+                self.assertEqual(result, expression.evaluate(bindings), msg=arg)
+                self.assertEqual(result, expression.to_function()(*bindings.values())
+                                 if expression.variables else expression.to_function()(), msg=arg)
+
+    def test_deadline(self):
+        limits = EvaluationLimits(timeout=0.05)
+
+        def slow(value):
+            time.sleep(0.1)
+            return value
+
+        expression = Expression('slow(1)+slow(2)', callable_objects=[Callable('slow', slow)], limits=limits)
+        with self.assertRaises(PyCalcLimitError):
+            expression.evaluate()
+        with limits.deadline():
+            self.assertIsNone(limits.check_deadline())
+
+    def test_folding_respects_limits(self):
+        tree = Expression('9^9^9', limits=self.limits).optimize()
+        self.assertIsInstance(tree, Binary)
+        self.assertEqual(Literal(9 ** 9), tree.right)
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = ModulesScope('builtins', 'math')
+
+    def test_times(self):
+        profiler = Profiler(timer=itertools.count().__next__)
+        self.assertEqual(7, profiler.evaluate(Expression('1+2*3').compile()))
+        report = profiler.report(7)
+        self.assertEqual([ProfileEntry('*', 1, 5, 3), ProfileEntry('+', 1, 9, 3)], report.operators)
+        self.assertEqual([ProfileEntry('1+(2*3)', 1, 9, 3), ProfileEntry('2*3', 1, 5, 3)],
+                         report.subexpressions)
+
+    def test_profile(self):
+        report = Expression('sin(x)^2+cos(x)^2-(-max(1, 2))', scope=self.scope).profile({'x': 0.5})
+        self.assertAlmostEqual(3, report.result)
+        self.assertEqual(['tokenize', 'parse', 'evaluate'], list(report.phases))
+        self.assertEqual({'^', '+', '-', ',', 'unary -'}, {entry.name for entry in report.operators})
+        self.assertEqual({'sin': 1, 'cos': 1, 'max': 1},
+                         {entry.name: entry.calls for entry in report.callables})
+        self.assertEqual('(sin(x)^2)+((cos(x)^2)-(-max(1,2)))', report.subexpressions[0].name)
+        self.assertIn('sin(x)^2', format_report(report))
+
+    def test_node_source(self):
+        tree = Expression('+'.join(['1'] * 100)).compile()
+        self.assertEqual(63, len(node_source(tree)))
+        self.assertTrue(node_source(tree).endswith('...'))
+        self.assertEqual('2^(3^4)', node_source(Expression('2^3^4').compile()))
+
+    def test_limits(self):
+        limits = EvaluationLimits(max_exponent=1000)
+        with self.assertRaises(PyCalcLimitError):
+            Expression('9^9^9', limits=limits).profile()
+        with self.assertRaises(PyCalcSyntaxError):
+            Expression('x+1').profile()
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counters(self):
+        metrics = MetricsRegistry(buckets=(1, 10), timer=itertools.count(0, 5).__next__)
+        expression = Expression('x/y', metrics=metrics)
+        self.assertEqual(2, expression.evaluate({'x': 4, 'y': 2}))
+        self.assertEqual([1, 2], list(expression.evaluate_many([(1, 1), {'x': 2, 'y': 1}])))
+        with self.assertRaises(ZeroDivisionError):
+            expression.evaluate({'x': 1, 'y': 0})
+        with self.assertRaises(PyCalcSyntaxError):
+            Expression('1+', metrics=metrics).compile()
+        with self.assertRaises(PyCalcSyntaxError):
+            Expression('1 2', metrics=metrics)
+        snapshot = metrics.snapshot()
+        self.assertEqual({PARSE: 2, EVALUATE: 4}, snapshot.counters)
+        self.assertEqual({PARSE: {'PyCalcSyntaxError': 2}, EVALUATE: {'ZeroDivisionError': 1}},
+                         snapshot.errors)
+        histogram = snapshot.histograms[EVALUATE]
+        self.assertEqual((1, 10, float('inf')), histogram.buckets)
+        self.assertEqual((0, 4, 4), histogram.counts)
+        self.assertEqual(20, histogram.sum)
+        metrics.reset()
+        self.assertEqual({PARSE: 0, EVALUATE: 0}, metrics.snapshot().counters)
+
+    def test_threads(self):
+        metrics = MetricsRegistry()
+        cache = ExpressionCache(metrics=metrics)
+
+        def evaluate():
+            for number in range(500):
+                cache.get('{}+1'.format(number % 10)).evaluate()
+
+        threads = [threading.Thread(target=evaluate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        snapshot = metrics.snapshot()
+        self.assertEqual(2000, snapshot.counters[EVALUATE])
+        self.assertEqual(cache.info().misses, snapshot.counters[PARSE])
+
+    def test_prometheus(self):
+        metrics = MetricsRegistry(buckets=(0.5,))
+        metrics.observe(EVALUATE, 0.25)
+        metrics.observe(EVALUATE, 1, ZeroDivisionError())
+        text = to_prometheus(metrics)
+        for line in [
+            '# TYPE pycalc_evaluation_duration_seconds histogram',
+            'pycalc_evaluation_duration_seconds_bucket{le="0.5"} 1',
+            'pycalc_evaluation_duration_seconds_bucket{le="+Inf"} 2',
+            'pycalc_evaluation_duration_seconds_sum 1.25',
+            'pycalc_evaluations_total 2',
+            'pycalc_expressions_parsed_total 0',
+            'pycalc_errors_total{operation="evaluate",kind="ZeroDivisionError"} 1',
+        ]:
+            self.assertIn(line, text.splitlines())
+
+
+class TestCompiledExpression(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = ModulesScope('builtins', 'math').freeze()
+
+    def test_frozen_scope(self):
+        self.assertEqual(pi, self.scope.constant_index.get('pi').value)
+        self.assertEqual(sin, self.scope.callable_index.get('sin').execute)
+        self.assertEqual(ModulesScope('builtins', 'math').freeze().fingerprint, self.scope.fingerprint)
+        with self.assertRaises(AttributeError):
+            self.scope._constants = ()
+        self.assertEqual(2, Expression('log(e^2)', scope=self.scope).execute())
+
+    def test_evaluate(self):
+        compiled = compile_expression('sin(x)^2+cos(x)^2+y', scope=self.scope)
+        self.assertIsInstance(compiled, CompiledExpression)
+        self.assertEqual(('x', 'y'), compiled.variables)
+        self.assertAlmostEqual(3, compiled.evaluate({'x': 0.3, 'y': 2}))
+        results = compiled.evaluate_many([(1, 0), {'x': 2, 'y': 1}])
+        self.assertEqual([1.0, 2.0], [round(value, 9) for value in results])
+        self.assertEqual(7, Expression('1+2 * 3').freeze().evaluate())
+        self.assertEqual([2, 2], list(compile_expression('1+1').evaluate_many([{}, ()])))
+        with self.assertRaises(PyCalcSyntaxError):
+            compiled.evaluate({'x': 1})
+        with self.assertRaises(AttributeError):
+            compiled.expr = '1'
+        with self.assertRaises(PyCalcLimitError):
+            compile_expression('x^y', limits=EvaluationLimits(max_exponent=10)).evaluate({'x': 2, 'y': 11})
+
+    def test_threads(self):
+        metrics = MetricsRegistry()
+        compiled = compile_expression('x*(x+1)//2+factorial(x%5)', scope=self.scope, metrics=metrics)
+        errors = []
+
+        def evaluate(start):
+            for x in range(start, start + 1000):
+                if compiled.evaluate({'x': x}) != x * (x + 1) // 2 + factorial(x % 5):
+                    errors.append(x)
+            expression = compile_expression('hypot(3, 4)*{}'.format(start), scope=self.scope)
+            if expression.evaluate() != 5 * start:
+                errors.append(start)
+
+        threads = [threading.Thread(target=evaluate, args=(start,)) for start in range(0, 8000, 1000)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual(8000, metrics.snapshot().counters[EVALUATE])
+
+
+class TestExpressionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ExpressionCache(maxsize=2)
+        self.scope = ModulesScope('builtins', 'math')
+
+    def test_get(self):
+        expression = self.cache.get('2+2')
+        self.assertIs(expression, self.cache.get(' 2+2 '))
+        self.assertIsNot(expression, self.cache.get('2+2', scope=self.scope))
+        self.assertEqual(1.0, self.cache.get('sin(pi/2)', scope=self.scope).execute())
+        self.assertEqual(CacheInfo(1, 3, 1, 2, 2), self.cache.info())
+
+    def test_lru_eviction(self):
+        first = self.cache.get('1')
+        self.cache.get('2')
+        self.cache.get('1')
+        self.cache.get('3')
+        self.assertIs(first, self.cache.get('1'))
+        self.cache.get('2')
+        self.assertEqual(CacheInfo(2, 4, 2, 2, 2), self.cache.info())
+
+    def test_spaces_are_not_normalized(self):
+        self.assertEqual(12, self.cache.get('12').execute())
+        with self.assertRaises(PyCalcSyntaxError):
+            self.cache.get('1 2')
+
+    def test_clear(self):
+        self.cache.get('1')
+        self.cache.clear()
+        self.assertEqual(CacheInfo(0, 0, 0, 0, 2), self.cache.info())
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_evaluate_lines(self):
+        scope = ModulesScope('builtins', 'math')
+        cache = ExpressionCache()
+        lines = iter(['2+2\n', '\n', ' 1/0 \n', 'pi\n', 'foo(\n', '2+2'])
+        results = evaluate_lines(lines, scope=scope, cache=cache)
+        self.assertEqual((1, '2+2', 4, None), next(results))
+        self.assertEqual([
+            (2, '', None, None),
+            (3, '1/0', None, 'zero division error'),
+            (4, 'pi', pi, None),
+            (5, 'foo(', None, 'unknown name "foo"'),
+            (6, '2+2', 4, None),
+        ], list(results))
+        self.assertEqual(1, cache.info().hits)
+
+    def test_run_batch(self):
+        output = io.StringIO()
+        errors = run_batch(io.StringIO('1+2\n\n2*(3\nabs(-2)\n'), output)
+        self.assertEqual(1, errors)
+        self.assertEqual('3\n\nERROR: invalid brackets are not balanced\n2\n', output.getvalue())
+
+    def test_any_error(self):
+        output = io.StringIO()
+        errors = run_batch(io.StringIO('1+2\n__import__(chr(120))\nabs(-2)\n'), output)
+        self.assertEqual(1, errors)
+        self.assertEqual("3\nERROR: No module named 'x'\n2\n", output.getvalue())
+
+
+class TestParallel(CacheDirectoryMixin, unittest.TestCase):
+
+    def test_split_chunks(self):
+        self.assertEqual([(1, ['a', 'b']), (3, ['c', 'd']), (5, ['e'])], list(split_chunks('abcde', 2)))
+        self.assertEqual([], list(split_chunks([], 2)))
+
+    def test_evaluate_parallel(self):
+        lines = ['{}*2'.format(number) for number in range(50)] + ['1/0', 'sqrt(16)']
+        results = list(evaluate_parallel(lines, jobs=2, chunksize=7))
+        self.assertEqual(list(range(1, 53)), [result.line_number for result in results])
+        self.assertEqual([str(number * 2) for number in range(50)], [result.value for result in results[:50]])
+        self.assertEqual('zero division error', results[50].error)
+        self.assertEqual('4.0', results[51].value)
+
+    def test_unpicklable_and_errors(self):
+        lines = ['1+1', '__import__(chr(120))', 'memoryview(bytes(3))', '2+2']
+        results = list(evaluate_parallel(lines, jobs=2, chunksize=1))
+        self.assertEqual(['2', None, '4'], [results[0].value, results[1].value, results[3].value])
+        self.assertEqual("No module named 'x'", results[1].error)
+        self.assertTrue(results[2].value.startswith('<memory'))
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'unix sockets are not supported')
+class TestDaemon(CacheDirectoryMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'pycalc.sock')
+        self.server = EvaluationServer(self.path)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.01,))
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.directory.cleanup()
+        super().tearDown()
+
+    def test_forward(self):
+        self.assertEqual({'result': '4'}, forward('2+2', ['builtins', 'math'], self.path))
+        self.assertEqual({'result': '1.0'}, forward('sin(pi/2)', ['builtins', 'math'], self.path))
+        self.assertEqual({'error': 'zero division error'}, forward('1/0', ['builtins'], self.path))
+        self.assertIsNone(forward('sqrt(-1)', ['builtins', 'math'], self.path))
+        self.assertIsNone(forward('print(5)', ['builtins'], self.path))
+        self.assertIsNone(forward('input', ['builtins'], self.path))
+
+    def test_daemon_is_not_running(self):
+        path = os.path.join(self.directory.name, 'other.sock')
+        self.assertIsNone(forward('2+2', ['builtins'], path))
+        EvaluationServer(path).server_close()
+        self.assertFalse(os.path.exists(path))
+        with self.assertRaises(OSError):
+            EvaluationServer(self.path)
+
+
+class TestAsyncEvaluator(unittest.TestCase):
+
+    def test_evaluate(self):
+        async def evaluate():
+            async with AsyncEvaluator(ModulesScope('builtins', 'math'), max_batch=8) as evaluator:
+                results = await asyncio.gather(*(evaluator.evaluate('{}*2'.format(idx)) for idx in range(20)))
+                self.assertEqual([idx * 2 for idx in range(20)], results)
+                self.assertEqual(1.0, await evaluator.evaluate('sin(pi/2)'))
+                with self.assertRaises(ZeroDivisionError):
+                    await evaluator.evaluate('1/0')
+                with self.assertRaises(asyncio.TimeoutError):
+                    await evaluator.evaluate('2+2', timeout=0)
+                self.assertEqual(4, await evaluator.evaluate('2+2'))
+        asyncio.run(evaluate())
+
+    def test_pure_only(self):
+        async def evaluate():
+            async with AsyncEvaluator(ModulesScope('builtins'), pure_only=True) as evaluator:
+                self.assertEqual(2, await evaluator.evaluate('abs(-2)'))
+                with self.assertRaises(PyCalcSyntaxError) as context:
+                    await evaluator.evaluate('print(abs(-2))')
+                self.assertEqual('callable objects with side effects are not allowed', context.exception.message)
+        asyncio.run(evaluate())
+
+    def test_backpressure(self):
+        async def evaluate():
+            async with AsyncEvaluator(max_batch=2, max_pending=1) as evaluator:
+                results = await asyncio.gather(*(evaluator.evaluate(str(idx)) for idx in range(10)))
+                self.assertEqual(list(range(10)), results)
+        asyncio.run(evaluate())
+
+    def test_handle_connection(self):
+        async def communicate():
+            async with AsyncEvaluator() as evaluator:
+                server = await asyncio.start_server(
+                    lambda reader, writer: handle_connection(evaluator, reader, writer), '127.0.0.1', 0
+                )
+                async with server:
+                    port = server.sockets[0].getsockname()[1]
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                    writer.write(b'{"id": 1, "expression": "2+2"}\nnot json\n{"id": 2, "expression": "1/0"}\n')
+                    writer.write_eof()
+                    responses = [json.loads(line) async for line in reader]
+                    writer.close()
+            return responses
+        self.assertEqual([
+            {'id': 1, 'result': '4'},
+            {'error': 'invalid request'},
+            {'id': 2, 'error': 'zero division error'},
+        ], asyncio.run(communicate()))
+
+
+class TestCodegen(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = ModulesScope('builtins', 'math')
+
+    def expression(self, expr):
+        return Expression(expr, callable_objects=self.scope.get_callable_objects(),
+                          constants=self.scope.get_constants())
+
+    def test_to_function(self):
+        test_list = [
+            ('round(2*(- 5 +9^3), 2)', (), 1448),
+            ('-sin(2)^2', (), -0.826821810431806),
+            ('2^2^3', (), 2 ** 2 ** 3),
+            ('100/3%2^2', (), 100 / 3 % 2 ** 2),
+            ('10(2+1)', (), 30),
+            ('x*sin(y)', (2, pi / 2), 2.0),
+            ('round(x, 1)', (2.46,), 2.5),
+        ]
+        for arg, args, result in test_list:
+            function = self.expression(arg).to_function()
+            self.assertEqual(result, function(*args), msg=arg)
+
+    def test_comma_operator(self):
+        test_list = [
+            ('max((1,2),3)', (), 3),
+            ('max(divmod(7,2),1)', (), 3),
+            ('max(x)', ((4, 5),), 5),
+            ('x,1', ((1, 2),), (1, 2, 1)),
+        ]
+        for arg, args, result in test_list:
+            function = self.expression(arg).to_function()
+            self.assertEqual(result, function(*args), msg=arg)
+
+    def test_large_expressions(self):
+        self.assertEqual(5000, Expression('+'.join(['x'] * 5000)).to_function()(1))
+        self.assertEqual(2, Expression('(' * 1000 + '2' + ')' * 1000).to_function()())
+        self.assertEqual(-1, Expression('-' * 1001 + '1').to_function()())
+
+
+@unittest.skipUnless(numpy, 'numpy is not installed')
+class TestVectorize(unittest.TestCase):
+
+    def setUp(self):
+        self.scope = ModulesScope('builtins', 'math')
+
+    def expression(self, expr):
+        return Expression(expr, callable_objects=self.scope.get_callable_objects(),
+                          constants=self.scope.get_constants())
+
+    def test_evaluate_arrays(self):
+        x = numpy.array([0.5, 1.0, 2.0])
+        y = numpy.array([1.0, 2.0, 3.0])
+        result = self.expression('x*sin(y)+log(x, 2)^2-sqrt(y)').evaluate({'x': x, 'y': y})
+        expected = [a * sin(b) + log(a, 2) ** 2 - b ** .5 for a, b in zip(x, y)]
+        self.assertTrue(numpy.allclose(expected, result))
+
+    def test_comparison_and_scalars(self):
+        x = numpy.arange(5)
+        result = self.expression('x^2>=4+e-e').evaluate({'x': x})
+        self.assertEqual([False, False, True, True, True], list(result))
+
+    def test_power(self):
+        x = numpy.arange(5)
+        self.assertEqual([pow(value, 2, 5) for value in range(5)],
+                         list(Expression('pow(x, 2, 5)').evaluate({'x': x})))
+        self.assertEqual([value ** 40 for value in range(5)],
+                         list(self.expression('x^40').evaluate({'x': x})))
+        self.assertEqual(numpy.int64, self.expression('x^2').evaluate({'x': x}).dtype)
+        result = self.expression('pow(x, 40)+pow(x+1,-1)').evaluate({'x': x})
+        self.assertEqual(numpy.float64, result.dtype)
+        self.assertEqual([pow(value, 40) + pow(value + 1, -1) for value in range(5)], list(result))
+
+    def test_elementwise_fallback(self):
+        x = numpy.array([1.2, 2.7, 3.5])
+        result = self.expression('factorial(int(x))+x').evaluate({'x': x})
+        self.assertTrue(numpy.allclose([2.2, 4.7, 9.5], result))
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_corpus(self):
+        for case in CORPUS:
+            scope = ModulesScope(*case.modules)
+            for expr in case.expressions:
+                Expression(expr, scope=scope).execute()
+
+    def test_compare(self):
+        report = run(repeat=1, number=1, cases=['short_arithmetic'])
+        self.assertEqual({'scope', 'init', 'execute'}, set(report['results']['short_arithmetic']))
+        baseline = {'results': {'short_arithmetic': {'scope': 1.0, 'init': 1.0, 'execute': 1.0}}}
+        current = {'results': {'short_arithmetic': {'scope': 1.1, 'init': 1.5, 'execute': 0.5}}}
+        self.assertEqual([('short_arithmetic', 'init', 1.0, 1.5, 1.5)], compare(current, baseline, 0.25))
+
+
+class TestScaling(unittest.TestCase):
+
+    def test_fit_exponent(self):
+        sizes = [100, 200, 400, 800]
+        self.assertAlmostEqual(1, fit_exponent(sizes, [size * 3e-6 for size in sizes]))
+        self.assertAlmostEqual(2, fit_exponent(sizes, [size ** 2 * 1e-9 for size in sizes]))
+
+    def test_generators(self):
+        scope = ModulesScope('builtins', 'math')
+        for name, generator in GENERATORS.items():
+            with self.subTest(name):
+                Expression(generator(10), scope=scope).execute()
+
+
+class TestE2E(CacheDirectoryMixin, unittest.TestCase):
 
     def main_assert_equal(self, test_list):
         for arg, result in test_list: